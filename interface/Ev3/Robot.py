@@ -11,7 +11,13 @@ class ReducedMotor:
         self.motor = motor
         self.reduction = reduction
 
+        # Reading the motor goes through sysfs, slow on the brick: the last
+        # commanded target and the last polled position are kept here
+        self.target = None
+        self.position = None
+
     def on_to_position(self, speed, position, brake=True, block=True):
+        self.target = position
         self.motor.on_to_position(
             speed, position * self.reduction, brake=brake, block=block
         )
@@ -23,10 +29,15 @@ class ReducedMotor:
 
     def set_position(self, pos):
         self.motor.position = pos* self.reduction
+        self.target = self.position = pos
 
     def get_position(self):
         return self.motor.position / self.reduction
 
+    def poll(self):
+        self.position = self.get_position()
+        return self.position
+
 
 class Robot:
     def __init__(self):
@@ -49,19 +60,31 @@ class Robot:
         # claw.run_until_stalled(5)
         claw.set_position(0)
         self.claw = claw
-    
+
+        self.motors = (base, shoulder, elbow, claw)
+        self.speeds = (SpeedPercent(100), SpeedPercent(10), SpeedPercent(40), SpeedPercent(20))
+
+    def poll(self):
+        """Reads the measured positions, call it periodically"""
+        for motor in self.motors:
+            motor.poll()
+
+    def get_positions(self):
+        """Last polled joint positions, with the signs used by move"""
+        return (
+            self.base.position,
+            -self.shoulder.position,
+            -self.elbow.position,
+            self.claw.position,
+        )
 
     def move(self, q1, q2, q3, q4):
+        # Compared with the last targets, so no motor is read here
         q2 = -q2
         q3 = -q3
-        if abs(self.base.get_position() - q1)>delta_angle:
-            self.base.on_to_position(SpeedPercent(100), q1, block=False)
-        if abs(self.shoulder.get_position() - q2)>delta_angle:
-            self.shoulder.on_to_position(SpeedPercent(10), q2, block=False)
-        if abs(self.elbow.get_position() - q3)>delta_angle:
-            self.elbow.on_to_position(SpeedPercent(40), q3, block=False)
-        if abs(self.claw.get_position() - q4)>delta_angle:
-            self.claw.on_to_position(SpeedPercent(20), q4, block=False)
+        for motor, speed, q in zip(self.motors, self.speeds, (q1, q2, q3, q4)):
+            if abs(motor.target - q)>delta_angle:
+                motor.on_to_position(speed, q, block=False)
 
 
 def main():
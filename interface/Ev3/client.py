@@ -1,33 +1,327 @@
+import asyncio
+import concurrent.futures
 import socket
+import threading
+from time import monotonic, perf_counter, time
+
+import numpy as np
+
+from Ev3.protocol import (ABORT, HEARTBEAT, HELLO, PROGRESS, SETPOINT, START, TELEMETRY,
+                          TELEMETRY_RATE, TRAJECTORY, WAYPOINT, Decoder, encode_abort,
+                          encode_ascii, encode_frame, encode_hello, encode_setpoint,
+                          encode_start, encode_telemetry_rate, encode_trajectory)
+from Ev3.latency import LatencyRecorder
+from Ev3.telemetry import TelemetryBuffer
+
+
+class LinkDead(ConnectionError):
+    pass
+
 
 class Ev3Client:
 
-    def __init__(self, host: str, port: int = 12345):
+    """
+        Connection with the Ev3, run by an asyncio loop in its own thread.
+
+        Commands go through a bounded queue: when it is full the caller
+        waits up to send_timeout (backpressure) and the command is dropped
+        after that. While disconnected commands are dropped at once, and
+        the ones still queued when the connection is lost are discarded,
+        so no stale setpoint is sent on reconnection. The connection is
+        reopened with exponential backoff when it fails or when the Ev3
+        stops answering the heartbeats.
+    """
+
+    def __init__(self, host: str, port: int = 12345, protocol: str = "auto",
+                 queue_size: int = 256, send_timeout: float = 0.5,
+                 heartbeat: float = 1.0):
         self.host = host
         self.port = port
-        self.client = self.connect()
+        self.protocol = protocol    # "auto", "binary" or "ascii"
+        self.binary = protocol == "binary"
+        self.seq = 0                # Next setpoint number
+        self.trajectory_id = 0
+        self.numbering = threading.Lock()   # Numbers and queues commands as one step
+        self.progress = None        # Last PROGRESS of an uploaded trajectory
+        self.telemetry = TelemetryBuffer()
+        self.latency = LatencyRecorder()    # Interface side stages, see Ev3/latency.py
+
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.heartbeat = heartbeat
+        self.min_backoff, self.max_backoff = 0.1, 5.0
+
+        # Metrics
+        self.connections = 0        # Successful connections, reconnections included
+        self.sent = 0
+        self.dropped = 0            # Commands not queued within send_timeout
+        self.discarded = 0          # Commands submitted or queued while disconnected
+        self.queue_delay = 0.0      # Time the last command waited in the queue
+        self.max_queue_delay = 0.0
+        self.heartbeat_rtt = None
+        self.heartbeat_sent = None
+        self.last_received = None
+
+        # Event loop running the connection
+        self.closing = False
+        self.connected = threading.Event()
+        self.ready = threading.Event()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.run(), self.loop)
+        self.ready.wait()
+
+    def connect(self, timeout: float = 1.0) -> bool:
+
+        """ Wait until connected, the connection is (re)opened in background """
+
+        if not self.connected.wait(timeout):
+            print(f"Error: was not possible connect to {self.host}:{self.port}, retrying in background")
+            return False
+        return True
+
+    def health(self) -> dict:
+
+        """ Connection state and how much the commands are being delayed """
+
+        return {
+            "connected": self.connected.is_set(),
+            "binary": self.binary,
+            "connections": self.connections,
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue_size,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "discarded": self.discarded,
+            "queue_delay_ms": self.queue_delay*1e3,
+            "max_queue_delay_ms": self.max_queue_delay*1e3,
+            "heartbeat_rtt_ms": None if self.heartbeat_rtt is None else self.heartbeat_rtt*1e3,
+            "since_received_s": None if self.last_received is None else monotonic() - self.last_received,
+        }
+
+    # Connection (event loop thread)
+
+    async def run(self):
+        self.task = asyncio.current_task()
+        self.queue = asyncio.Queue(self.queue_size)
+        self.ready.set()
+
+        backoff = self.min_backoff
+        while not self.closing:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.heartbeat)
+            except (OSError, asyncio.TimeoutError):
+                await asyncio.sleep(backoff)
+                backoff = min(2*backoff, self.max_backoff)
+                continue
+
+            writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                decoder = Decoder()
+                if self.protocol == "auto":
+                    self.binary = await self.negotiate(reader, writer, decoder)
+                self.last_received = monotonic()
+                self.connections += 1
+                self.discard_queued()
+                self.connected.set()
+                backoff = self.min_backoff
+                print(f"Connected to the server {self.host}:{self.port}")
+                await self.serve(reader, writer, decoder)
+            except OSError:
+                pass
+            finally:
+                self.connected.clear()
+                self.discard_queued()
+                writer.close()
+            if not self.closing:
+                print(f"Connection with {self.host}:{self.port} lost, reconnecting")
+                await asyncio.sleep(backoff)
+                backoff = min(2*backoff, self.max_backoff)
+
+    def discard_queued(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.discarded += 1
+
+    async def enqueue(self, command) -> bool:
+
+        """ Queue a command if connected, waiting while the queue is full """
+
+        if not self.connected.is_set():
+            self.discarded += 1
+            return False
+        await self.queue.put(command)
+        return True
+
+    async def negotiate(self, reader, writer, decoder, timeout: float = 0.5) -> bool:
 
-    def connect(self):
-        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        """ Send HELLO and wait for the answer, older Ev3 programs ignore it """
+
+        writer.write(encode_hello())
+        await writer.drain()
+        deadline = monotonic() + timeout
+        try:
+            while True:
+                data = await asyncio.wait_for(reader.read(64), max(0, deadline - monotonic()))
+                if not data:
+                    raise ConnectionError("Connection closed during HELLO")
+                if any(kind == HELLO for kind, _ in decoder.feed(data)):
+                    return True
+        except asyncio.TimeoutError:
+            print("Ev3 did not answer HELLO, using the ASCII protocol")
+            return False
+
+    async def serve(self, reader, writer, decoder):
+
+        """ Run sender, receiver and heartbeats until one of them fails """
+
+        tasks = [asyncio.ensure_future(self.send_commands(writer)),
+                 asyncio.ensure_future(self.receive(reader, decoder))]
+        if self.binary:
+            tasks.append(asyncio.ensure_future(self.send_heartbeats(writer)))
         try:
-            client.connect((self.host, self.port))
-            print(f"Connected to the server {self.host}:{self.port}")
-            return client
-        except ConnectionRefusedError:
-            print(f"Error: was not possible connect to {self.host}:{self.port}")
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, OSError):
+                raise error
+
+    async def send_commands(self, writer):
+        while True:
+            kind, payload, queued = await self.queue.get()
+            self.queue_delay = perf_counter() - queued
+            self.max_queue_delay = max(self.max_queue_delay, self.queue_delay)
+            frame = self.encode(kind, payload)
+            if frame is not None:
+                writer.write(frame)
+                await writer.drain()
+                self.sent += 1
+                if kind in (SETPOINT, WAYPOINT):
+                    self.latency.record("send", perf_counter() - payload[2])
+
+    async def receive(self, reader, decoder):
+        while True:
+            data = await reader.read(1024)
+            if not data:
+                raise ConnectionError("Connection closed by the Ev3")
+            self.last_received = monotonic()
+            for kind, value in decoder.feed(data):
+                if kind == PROGRESS:
+                    self.progress = value
+                elif kind == TELEMETRY:
+                    self.telemetry.add(value)
+                elif kind == HEARTBEAT:
+                    self.heartbeat_rtt = self.last_received - self.heartbeat_sent
+
+    async def send_heartbeats(self, writer):
+        while True:
+            self.heartbeat_sent = monotonic()
+            writer.write(encode_frame(HEARTBEAT))
+            await writer.drain()
+            await asyncio.sleep(self.heartbeat)
+            if monotonic() - self.last_received > 3*self.heartbeat:
+                raise LinkDead("Ev3 stopped answering heartbeats")
+
+    def encode(self, kind, payload):
+        if kind in (SETPOINT, WAYPOINT):
+            seq, joints, _ = payload
+            if self.binary:
+                self.telemetry.record_setpoint(seq, joints)
+                return encode_setpoint(seq, time(), joints, kind)
+            return encode_ascii(joints)
+        if not self.binary:
+            print("Error: trajectory commands require the binary protocol")
             return None
+        if kind == TRAJECTORY:
+            return encode_trajectory(*payload)
+        if kind == START:
+            return encode_start(payload)
+        if kind == ABORT:
+            return encode_abort()
+        if kind == TELEMETRY_RATE:
+            return encode_telemetry_rate(payload)
 
-    def set_position(self, j1, j2, j3, j4):
+    # Commands (any thread)
 
+    def submit(self, kind, payload) -> bool:
+
+        """
+            Queue a command, waiting up to send_timeout when the queue is
+            full. Dropped at once while disconnected
+        """
+
+        future = asyncio.run_coroutine_threadsafe(
+            self.enqueue((kind, payload, perf_counter())), self.loop)
         try:
-            msg = f"#{j1};{j2};{j3};{j4}".encode("ASCII")
-            self.client.sendall(msg)
-        except:
-            print(f"Error: was not possible send the point to Ev3")
+            return future.result(self.send_timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self.dropped += 1
+            print("Error: was not possible send the point to Ev3, queue full")
+            return False
+
+    def upload_trajectory(self, time, j1, j2, j3, j4):
+
+        """
+            Send a whole sampled trajectory (time in seconds, joints as
+            for set_position) to be played by the Ev3. Returns its id
+        """
+
+        if not self.binary:
+            print("Error: uploading trajectories requires the binary protocol")
+            return None
+        samples = np.column_stack([time, j1, j2, j3, j4]).astype("<f4")
+        self.progress = None
+        with self.numbering:
+            self.trajectory_id += 1
+            trajectory_id = self.trajectory_id
+            self.submit(TRAJECTORY, (trajectory_id, samples.tobytes()))
+        return trajectory_id
+
+    def start_trajectory(self, trajectory_id: int):
+        self.submit(START, trajectory_id)
+
+    def abort_trajectory(self):
+        self.submit(ABORT, None)
+
+    def set_telemetry_rate(self, rate: float):
+
+        """ Frequency (Hz) of the measured positions sent by the Ev3, 0 stops it """
+
+        self.submit(TELEMETRY_RATE, rate)
+
+    def set_position(self, j1, j2, j3, j4, must_execute: bool = False, generated: float = None):
+
+        """
+            Send a setpoint. The Ev3 only executes the newest setpoint it
+            received, unless must_execute (binary protocol only). generated
+            is the perf_counter() time the point was produced, now if None
+        """
+
+        kind = WAYPOINT if must_execute else SETPOINT
+        generated = perf_counter() if generated is None else generated
+        # Unique numbers, queued in order, from any thread
+        with self.numbering:
+            self.submit(kind, (self.seq, (j1, j2, j3, j4), generated))
+            self.seq += 1
+
+    async def shutdown(self):
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.loop.stop()
 
     def close(self):
-        self.client.close()
+        self.closing = True
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop)
+        self.thread.join(1.0)
 
 if __name__ == "__main__":
-    ev3 = Ev3Client()
-    ev3.set_position(0,-10,20,-150)
\ No newline at end of file
+    ev3 = Ev3Client("localhost")
+    ev3.connect()
+    ev3.set_position(0,-10,20,-150)
@@ -0,0 +1,73 @@
+"""
+Latest-wins buffering of the received setpoints.
+
+The receiving thread puts every message in a ring buffer and the control
+loop takes one setpoint per tick: the newest one, unless a WAYPOINT is
+pending, in which case the oldest waypoint is executed first. The Ev3 then
+never falls behind the sender, however fast it sends.
+"""
+
+import threading
+from collections import deque
+from time import monotonic
+
+from protocol import SETPOINT, WAYPOINT
+
+
+class CommandBuffer:
+    def __init__(self, size=256, latency=None):
+        self.queue = deque()  # (kind, setpoint, time it was put)
+        self.size = size
+        self.lock = threading.Lock()
+        self.latency = latency  # LatencyRecorder of the time spent buffered
+
+        # Counters
+        self.received = 0
+        self.dropped = 0  # Overwritten in the full ring buffer
+        self.coalesced = 0  # Replaced by a newer setpoint
+        self.executed = 0
+
+    def put(self, kind, setpoint):
+        with self.lock:
+            self.received += 1
+            if len(self.queue) == self.size:
+                # Make room dropping the oldest setpoint, waypoints last
+                kinds = [k for k, _, _ in self.queue]
+                oldest = kinds.index(SETPOINT) if SETPOINT in kinds else 0
+                del self.queue[oldest]
+                self.dropped += 1
+            self.queue.append((kind, setpoint, monotonic()))
+
+    def take(self):
+        """Setpoint to execute in this tick, None if nothing arrived"""
+        with self.lock:
+            if not self.queue:
+                return None
+
+            # Oldest waypoint, the setpoints sent before it are skipped
+            for i, (kind, setpoint, put) in enumerate(self.queue):
+                if kind == WAYPOINT:
+                    for _ in range(i + 1):
+                        self.queue.popleft()
+                    self.coalesced += i
+                    break
+            else:
+                # Otherwise the newest setpoint
+                kind, setpoint, put = self.queue.pop()
+                self.coalesced += len(self.queue)
+                self.queue.clear()
+
+            self.executed += 1
+            if self.latency is not None:
+                self.latency.record("buffer", monotonic() - put)
+            return setpoint
+
+    def statistics(self):
+        with self.lock:
+            return {
+                "received": self.received,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "executed": self.executed,
+                "pending": len(self.queue),
+            }
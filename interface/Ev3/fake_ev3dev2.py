@@ -0,0 +1,94 @@
+"""
+Fake ev3dev2.motor backend to run Robot.py on a normal Linux box.
+
+Each motor keeps its attributes in files, like the ev3dev sysfs, so reads
+and writes pay real file I/O and are counted. Call install() before
+importing Robot.
+"""
+
+import os
+import sys
+import tempfile
+import types
+
+OUTPUT_A = "outA"
+OUTPUT_B = "outB"
+OUTPUT_C = "outC"
+OUTPUT_D = "outD"
+
+
+class SpeedValue:
+    def __init__(self, value):
+        self.value = value
+
+
+class SpeedPercent(SpeedValue):
+    pass
+
+
+class SpeedDPS(SpeedValue):
+    pass
+
+
+class Motor:
+    max_speed = 1050
+    directory = None
+
+    def __init__(self, address):
+        self.address = address
+        if Motor.directory is None:
+            Motor.directory = tempfile.mkdtemp(prefix="fake_ev3dev2_")
+        self.path = os.path.join(Motor.directory, address)
+        os.makedirs(self.path, exist_ok=True)
+        self.reads = 0
+        self.writes = 0
+        self.write("position", 0)
+        self.write("position_sp", 0)
+
+    def read(self, attribute):
+        self.reads += 1
+        with open(os.path.join(self.path, attribute)) as f:
+            return int(f.read())
+
+    def write(self, attribute, value):
+        self.writes += 1
+        with open(os.path.join(self.path, attribute), "w") as f:
+            f.write(str(int(value)))
+
+    @property
+    def position(self):
+        return self.read("position")
+
+    @position.setter
+    def position(self, value):
+        self.write("position", value)
+
+    def on_to_position(self, speed, position, brake=True, block=True):
+        # Motors reach the target at once, only the sysfs traffic matters
+        self.write("position_sp", position)
+        self.write("position", position)
+
+    def run_direct(self, duty_cycle_sp=0):
+        pass
+
+    def wait_until(self, state):
+        pass
+
+    def stop(self, stop_action="brake"):
+        pass
+
+
+class LargeMotor(Motor):
+    max_speed = 1050
+
+
+class MediumMotor(Motor):
+    max_speed = 1560
+
+
+def install():
+    """Registers this module as ev3dev2.motor"""
+    package = types.ModuleType("ev3dev2")
+    package.motor = sys.modules[__name__]
+    sys.modules["ev3dev2"] = package
+    sys.modules["ev3dev2.motor"] = sys.modules[__name__]
@@ -0,0 +1,33 @@
+"""
+Streams the measured joint positions back to the interface.
+
+Each telemetry message carries the Ev3 time and the seq of the last
+executed setpoint, so the interface can measure tracking error and the
+closed-loop latency.
+"""
+
+from time import time
+
+from protocol import encode_telemetry
+
+
+class TelemetrySender:
+    def __init__(self, robot, send, rate=10):
+        self.robot = robot
+        self.send = send
+        self.rate = rate  # Hz, 0 disables the telemetry
+        self.seq = 0
+        self.next_time = 0
+
+    def set_rate(self, rate):
+        self.rate = max(0, rate)
+        self.next_time = 0
+
+    def tick(self, now, setpoint_seq):
+        if self.rate <= 0 or now < self.next_time:
+            return
+        self.send(
+            encode_telemetry(self.seq, time(), setpoint_seq, self.robot.get_positions())
+        )
+        self.seq += 1
+        self.next_time = max(self.next_time + 1 / self.rate, now)
@@ -0,0 +1,129 @@
+"""
+Latency histograms of the control pipeline, cheap enough for the hot path.
+
+Each stage a setpoint goes through records its duration in a histogram of
+logarithmic bins (1 us to 100 s, 5% wide), so recording is O(1) without
+allocation and the percentiles are exact within a bin. The stages are:
+
+    interface (Ev3Client, perf_counter)
+        schedule    trajectory point deadline -> generated
+        send        generated -> written to the socket
+    Ev3 (main.py, monotonic)
+        network     sent -> received, wall clocks of both machines
+        parse       received -> decoded
+        buffer      decoded -> taken by the control loop
+        move        Robot.move call
+        total       sent -> Robot.move dispatched, wall clocks
+
+network and total compare time() of the interface and of the Ev3, they
+are only meaningful with synchronized clocks (or the simulator). Runs on
+the brick too, keep it Python 3.5 compatible.
+"""
+
+import json
+import math
+import threading
+
+MIN_LATENCY = 1e-6
+MAX_LATENCY = 100.0
+GROWTH = 1.05  # Ratio between the bounds of two consecutive bins
+
+LOG_GROWTH = math.log(GROWTH)
+BINS = int(math.ceil(math.log(MAX_LATENCY / MIN_LATENCY) / LOG_GROWTH)) + 2
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * BINS  # First bin below MIN_LATENCY, last above MAX
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        if seconds < MIN_LATENCY:
+            index = 0
+        else:
+            index = min(int(math.log(seconds / MIN_LATENCY) / LOG_GROWTH) + 1, BINS - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Upper bound of the bin holding the q-th percentile (0 to 100)"""
+        if self.count == 0:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(MIN_LATENCY * GROWTH ** index, self.max)
+        return self.max
+
+    def summary(self):
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": self.sum / self.count * 1e3,
+            "p50_ms": self.percentile(50) * 1e3,
+            "p99_ms": self.percentile(99) * 1e3,
+            "max_ms": self.max * 1e3,
+        }
+
+
+class LatencyRecorder:
+    """Histograms by stage, record() may be called from any thread"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.record(seconds)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def summary(self):
+        with self.lock:
+            return {
+                stage: histogram.summary()
+                for stage, histogram in self.histograms.items()
+            }
+
+    def report(self):
+        lines = []
+        for stage, summary in sorted(self.summary().items()):
+            if summary["count"]:
+                lines.append(
+                    "{:>8}: p50 {:8.3f} ms, p99 {:8.3f} ms, max {:8.3f} ms ({} samples)".format(
+                        stage,
+                        summary["p50_ms"],
+                        summary["p99_ms"],
+                        summary["max_ms"],
+                        summary["count"],
+                    )
+                )
+        return "\n".join(lines)
+
+    def export(self, path):
+        """Writes the summary and the raw bins of every stage as JSON"""
+        with self.lock:
+            data = {
+                "min_latency": MIN_LATENCY,
+                "growth": GROWTH,
+                "stages": {
+                    stage: dict(histogram.summary(), counts=list(histogram.counts))
+                    for stage, histogram in self.histograms.items()
+                },
+            }
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
@@ -1,51 +1,100 @@
 #!/usr/bin/env python3
 
-from time import time
+from time import monotonic, sleep, time
 
-from Com import Com
+from coalesce import CommandBuffer
+from feedback import TelemetrySender
+from latency import LatencyRecorder
+from player import TrajectoryPlayer
+from protocol import (
+    ABORT,
+    NO_SEQ,
+    SETPOINT,
+    START,
+    TELEMETRY_RATE,
+    TRAJECTORY,
+    WAYPOINT,
+)
 from Robot import Robot
+from server import Ev3Server
 
 HOST = "169.254.196.165"
 PORT = 12345
 
+CONTROL_PERIOD = 0.02  # Seconds between two motor commands
+REPORT_PERIOD = 5  # Seconds between two statistics reports
+TELEMETRY_RATE_HZ = 10  # Default, the interface may change it
+POLL_PERIOD = 0.1  # Seconds between two reads of the motor positions
+LATENCY_FILE = "latency.json"  # Histograms of the pipeline stages, see latency.py
 
-class ParseError(Exception):
-    pass
 
+def handle(kind, msg, commands, player, telemetry):
+    # Malformed messages are skipped by the decoder
+    if kind in (SETPOINT, WAYPOINT):
+        commands.put(kind, msg)
+    elif kind == TRAJECTORY:
+        player.load(msg)
+    elif kind == START:
+        player.start(msg, monotonic())
+    elif kind == ABORT:
+        player.abort()
+    elif kind == TELEMETRY_RATE:
+        telemetry.set_rate(msg)
 
-def parse(msg):
-    try:
-        msg = msg.decode("ASCII").split("#")
-        decoded = [float(x) for x in msg[1].split(";")]
-        if len(decoded) != 4:
-            raise ValueError
-    except Exception as error:
-        raise ParseError(repr(error))
 
-    return decoded
+def run(robot, server, stop=None, latency=None, latency_file=None):
+    """Serves the interface until stop (a threading.Event) is set"""
+    latency = LatencyRecorder() if latency is None else latency
+    commands = CommandBuffer(latency=latency)
+    player = TrajectoryPlayer(robot, server.send)
+    telemetry = TelemetrySender(robot, server.send, TELEMETRY_RATE_HZ)
+    server.handler = lambda kind, msg: handle(kind, msg, commands, player, telemetry)
+    server.latency = latency
+    server.start()
+    print("*" * 20, "Ready", "*" * 20,sep = "\n")
 
+    tick = last_report = last_poll = monotonic()
+    last_seq = NO_SEQ
+    while stop is None or not stop.is_set():
+        try:
+            # Setpoints received while playing a trajectory are discarded
+            setpoint = commands.take()
+            if not player.tick(monotonic()) and setpoint is not None:
+                dispatched = monotonic()
+                robot.move(*setpoint.joints)
+                latency.record("move", monotonic() - dispatched)
+                if setpoint.seq is not None:
+                    last_seq = setpoint.seq
+                    latency.record("total", time() - setpoint.timestamp)
 
-def main() -> None:
-    robot = Robot()
-    
+            # Motor reads are slow, keep them out of every command
+            if tick - last_poll >= POLL_PERIOD:
+                robot.poll()
+                last_poll = tick
+            telemetry.tick(tick, last_seq)
 
-    com = Com(HOST, PORT)
-    rec = com.receive(1024)
-    print("*" * 20, "Ready", "*" * 20,sep = "\n")
-    last_time = time()
-    while True:
-        msg = next(rec)
-        try:
-            robot.move(*parse(msg))
-            t = time()
-            print(t - last_time)
-            last_time = t
-        except ParseError as error:
-            print(repr(error))  # Might be slow
-            pass  # Ignore errors in communincation
+            if tick - last_report > REPORT_PERIOD:
+                print(commands.statistics())
+                print(latency.report())
+                if latency_file is not None:
+                    latency.export(latency_file)
+                last_report = tick
+
+            tick += CONTROL_PERIOD
+            sleep(max(0, tick - monotonic()))
         except KeyboardInterrupt:
             break
 
+    server.close()
+    if latency_file is not None:
+        latency.export(latency_file)
+    return commands.statistics()
+
+
+def main() -> None:
+    robot = Robot()
+    run(robot, Ev3Server(HOST, PORT), latency_file=LATENCY_FILE)
+
 
 if __name__ == "__main__":
     main()
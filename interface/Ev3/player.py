@@ -0,0 +1,75 @@
+"""
+Plays on the Ev3 a trajectory uploaded at once by the interface.
+
+Samples are executed against the Ev3 monotonic clock, so the network
+latency and jitter no longer reach the motion. Progress is reported back
+to the interface while playing and when the trajectory ends.
+"""
+
+import threading
+
+from protocol import ABORTED, FINISHED, RUNNING, encode_progress
+
+REPORT_PERIOD = 0.5  # Seconds between two progress messages
+
+
+class TrajectoryPlayer:
+    def __init__(self, robot, send):
+        self.robot = robot
+        self.send = send
+        self.lock = threading.Lock()
+
+        self.trajectory = None  # Last uploaded trajectory
+        self.playing = None
+        self.index = -1
+        self.start_time = 0
+        self.last_report = 0
+
+    def load(self, trajectory):
+        with self.lock:
+            self.trajectory = trajectory
+
+    def start(self, trajectory_id, now):
+        with self.lock:
+            if self.trajectory is None or self.trajectory.id != trajectory_id:
+                print("Trajectory", trajectory_id, "was not uploaded")
+                return
+            self.playing = self.trajectory
+            self.index = -1
+            self.start_time = self.last_report = now
+
+    def abort(self):
+        with self.lock:
+            if self.playing is not None:
+                self.report(ABORTED)
+                self.playing = None
+
+    def tick(self, now):
+        """Moves to the current sample, returns False when not playing"""
+        with self.lock:
+            if self.playing is None:
+                return False
+
+            samples = self.playing.samples
+            elapsed = now - self.start_time
+            index = self.index
+            while index + 1 < len(samples) and samples[index + 1][0] <= elapsed:
+                index += 1
+            if index != self.index:
+                self.robot.move(*samples[index][1:])
+                self.index = index
+
+            if self.index == len(samples) - 1:
+                self.report(FINISHED)
+                self.playing = None
+            elif now - self.last_report > REPORT_PERIOD:
+                self.report(RUNNING)
+                self.last_report = now
+            return True
+
+    def report(self, state):
+        self.send(
+            encode_progress(
+                self.playing.id, max(self.index, 0), len(self.playing.samples), state
+            )
+        )
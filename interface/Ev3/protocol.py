@@ -0,0 +1,224 @@
+"""
+Wire protocol between the interface (Ev3Client) and the Ev3 (main.py).
+
+Binary frames are a header (magic b"RR", version, type, payload length)
+followed by the payload. The legacy ASCII format "#j1;j2;j3;j4" is still
+accepted; the client falls back to it when the Ev3 does not answer the
+HELLO frame. This module also runs on the brick, keep it Python 3.5
+compatible (no f-strings, no variable annotations).
+"""
+
+import struct
+from collections import namedtuple
+
+MAGIC = b"RR"
+VERSION = 1
+
+# Frame types, a WAYPOINT is a setpoint the Ev3 must not skip
+HELLO = 0
+SETPOINT = 1
+WAYPOINT = 2
+TRAJECTORY = 3  # Whole sampled trajectory, played by the Ev3 on START
+START = 4
+ABORT = 5
+PROGRESS = 6  # Sent by the Ev3 while playing a trajectory
+HEARTBEAT = 7  # Echoed by the Ev3, keeps the connection alive
+TELEMETRY = 8  # Measured joint positions, sent by the Ev3
+TELEMETRY_RATE = 9  # Telemetry frequency requested by the interface
+
+# Trajectory states in PROGRESS
+RUNNING = 0
+FINISHED = 1
+ABORTED = 2
+
+HEADER = struct.Struct("<2sBBI")
+SETPOINT_PAYLOAD = struct.Struct("<Id4f")  # seq, timestamp, j1..j4
+TRAJECTORY_ID = struct.Struct("<I")
+SAMPLE = struct.Struct("<5f")  # time, j1..j4
+PROGRESS_PAYLOAD = struct.Struct("<IIIB")  # id, index, total, state
+# seq, Ev3 time, seq of the last executed setpoint, measured j1..j4
+TELEMETRY_PAYLOAD = struct.Struct("<IdI4f")
+RATE_PAYLOAD = struct.Struct("<f")  # Hz, 0 disables the telemetry
+
+# Setpoint seq when none was executed yet (or it came as ASCII)
+NO_SEQ = 0xFFFFFFFF
+
+# Larger payloads are treated as corruption
+MAX_PAYLOAD = 1 << 24
+
+# seq and timestamp are None for ASCII messages
+Setpoint = namedtuple("Setpoint", ["seq", "timestamp", "joints"])
+Trajectory = namedtuple("Trajectory", ["id", "samples"])
+Progress = namedtuple("Progress", ["id", "index", "total", "state"])
+Telemetry = namedtuple("Telemetry", ["seq", "timestamp", "setpoint_seq", "joints"])
+
+
+class ParseError(Exception):
+    pass
+
+
+def parse(msg):
+    """Decodes a single ASCII message b"#j1;j2;j3;j4" into 4 floats"""
+    try:
+        msg = msg.decode("ASCII").split("#")
+        decoded = [float(x) for x in msg[1].split(";")]
+        if len(decoded) != 4:
+            raise ValueError
+    except Exception as error:
+        raise ParseError(repr(error))
+
+    return decoded
+
+
+def encode_frame(kind, payload=b""):
+    return HEADER.pack(MAGIC, VERSION, kind, len(payload)) + payload
+
+
+def encode_hello():
+    return encode_frame(HELLO)
+
+
+def encode_setpoint(seq, timestamp, joints, kind=SETPOINT):
+    return encode_frame(
+        kind, SETPOINT_PAYLOAD.pack(seq & 0xFFFFFFFF, timestamp, *joints)
+    )
+
+
+def encode_trajectory(trajectory_id, samples):
+    """samples are the packed SAMPLE structs, or an iterable of 5-tuples"""
+    if not isinstance(samples, (bytes, bytearray)):
+        samples = b"".join(SAMPLE.pack(*sample) for sample in samples)
+    return encode_frame(TRAJECTORY, TRAJECTORY_ID.pack(trajectory_id) + samples)
+
+
+def encode_start(trajectory_id):
+    return encode_frame(START, TRAJECTORY_ID.pack(trajectory_id))
+
+
+def encode_abort():
+    return encode_frame(ABORT)
+
+
+def encode_progress(trajectory_id, index, total, state):
+    return encode_frame(
+        PROGRESS, PROGRESS_PAYLOAD.pack(trajectory_id, index, total, state)
+    )
+
+
+def encode_telemetry(seq, timestamp, setpoint_seq, joints):
+    return encode_frame(
+        TELEMETRY,
+        TELEMETRY_PAYLOAD.pack(seq & 0xFFFFFFFF, timestamp, setpoint_seq, *joints),
+    )
+
+
+def encode_telemetry_rate(rate):
+    return encode_frame(TELEMETRY_RATE, RATE_PAYLOAD.pack(rate))
+
+
+def encode_ascii(joints):
+    # The newline ends the message, older Ev3 programs ignore it
+    return "#{};{};{};{}\n".format(*joints).encode("ASCII")
+
+
+class Decoder:
+    """
+    Streaming decoder, feed it the bytes as they arrive from the socket.
+
+    Messages split across reads are kept until complete and reads holding
+    several messages are decoded entirely. Corrupted input is skipped up to
+    the next frame or ASCII message and counted in errors. ASCII messages
+    without a newline are complete only once the next message starts.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.errors = 0
+
+    def feed(self, data):
+        """Returns the list of complete messages as (type, value) pairs"""
+        self.buffer += data
+        buffer = self.buffer
+        messages = []
+        pos = 0
+
+        while pos < len(buffer):
+            start = buffer[pos : pos + 1]
+            if start == MAGIC[:1]:
+                if len(buffer) - pos < HEADER.size:
+                    break
+                magic, version, kind, length = HEADER.unpack_from(buffer, pos)
+                if magic != MAGIC or length > MAX_PAYLOAD:
+                    self.errors += 1
+                    pos += 1
+                    continue
+                end = pos + HEADER.size + length
+                if len(buffer) < end:
+                    break
+                message = self.decode_frame(version, kind, buffer, end - length, length)
+                if message is not None:
+                    messages.append(message)
+                pos = end
+
+            elif start == b"#":
+                end = self.ascii_end(buffer, pos + 1)
+                if end < 0:
+                    break
+                try:
+                    joints = parse(bytes(buffer[pos:end]))
+                    messages.append((SETPOINT, Setpoint(None, None, joints)))
+                except ParseError:
+                    self.errors += 1
+                pos = end
+
+            else:
+                # Garbage (or a line ending), skip to the next message
+                end = self.ascii_end(buffer, pos)
+                if buffer[pos : pos + 1] != b"\n":
+                    self.errors += 1
+                pos = len(buffer) if end < 0 else max(end, pos + 1)
+
+        del buffer[:pos]
+        return messages
+
+    def decode_frame(self, version, kind, buffer, offset, length):
+        if version != VERSION:
+            self.errors += 1
+            return None
+        if kind == HELLO:
+            return (HELLO, version)
+        if kind == HEARTBEAT:
+            return (HEARTBEAT, None)
+        if kind in (SETPOINT, WAYPOINT) and length == SETPOINT_PAYLOAD.size:
+            seq, timestamp, *joints = SETPOINT_PAYLOAD.unpack_from(buffer, offset)
+            return (kind, Setpoint(seq, timestamp, joints))
+        if (
+            kind == TRAJECTORY
+            and length >= TRAJECTORY_ID.size
+            and (length - TRAJECTORY_ID.size) % SAMPLE.size == 0
+        ):
+            (trajectory_id,) = TRAJECTORY_ID.unpack_from(buffer, offset)
+            data = bytes(buffer[offset + TRAJECTORY_ID.size : offset + length])
+            return (kind, Trajectory(trajectory_id, list(SAMPLE.iter_unpack(data))))
+        if kind == START and length == TRAJECTORY_ID.size:
+            return (kind, TRAJECTORY_ID.unpack_from(buffer, offset)[0])
+        if kind == ABORT and length == 0:
+            return (kind, None)
+        if kind == PROGRESS and length == PROGRESS_PAYLOAD.size:
+            return (kind, Progress(*PROGRESS_PAYLOAD.unpack_from(buffer, offset)))
+        if kind == TELEMETRY and length == TELEMETRY_PAYLOAD.size:
+            seq, timestamp, setpoint_seq, *joints = TELEMETRY_PAYLOAD.unpack_from(
+                buffer, offset
+            )
+            return (kind, Telemetry(seq, timestamp, setpoint_seq, joints))
+        if kind == TELEMETRY_RATE and length == RATE_PAYLOAD.size:
+            return (kind, RATE_PAYLOAD.unpack_from(buffer, offset)[0])
+        self.errors += 1
+        return None
+
+    @staticmethod
+    def ascii_end(buffer, pos):
+        """Index where the ASCII message ends (exclusive), -1 if incomplete"""
+        ends = [buffer.find(c, pos) for c in (b"\n", b"#", MAGIC[:1])]
+        ends = [end for end in ends if end >= 0]
+        return min(ends) if ends else -1
@@ -0,0 +1,132 @@
+"""
+Asyncio server of the Ev3, serving any number of interface clients.
+
+Each client gets TCP_NODELAY and its own decoder; HELLO and HEARTBEAT
+frames are answered here and every other message is passed to handler.
+Binary clients heartbeat, so one silent for timeout seconds is dropped.
+The event loop runs in its own thread, send() may be called from any.
+Messages are not sent to a client with more than max_buffer bytes still
+unsent, a slow reader loses messages instead of growing the buffer.
+"""
+
+import asyncio
+import socket
+import threading
+from time import monotonic, time
+
+from protocol import (
+    HEARTBEAT,
+    HELLO,
+    SETPOINT,
+    WAYPOINT,
+    Decoder,
+    encode_frame,
+    encode_hello,
+)
+
+
+class Ev3Server:
+    def __init__(self, host, port, handler=None, timeout=3.0, latency=None, max_buffer=65536):
+        self.host = host
+        self.port = port
+        self.handler = handler
+        self.timeout = timeout
+        self.max_buffer = max_buffer
+        self.dropped = 0  # Messages not sent to a slow client
+        self.latency = latency  # LatencyRecorder of the network and parse stages
+        self.loop = None
+        self.clients = set()  # Writers of the binary clients, see send()
+        self.server = None
+        self.tasks = set()  # Running handle() of every client
+        self.ready = threading.Event()
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        self.ready.wait()
+        return thread
+
+    def serve_forever(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.accept, self.host, self.port, reuse_address=True)
+        )
+        # The actual port, when 0 asked for any free one
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.ready.set()
+        self.loop.run_forever()
+
+        # Stopped by close(), disconnect the clients
+        self.server.close()
+        for task in self.tasks:
+            task.cancel()
+        if self.tasks:
+            self.loop.run_until_complete(
+                asyncio.gather(*self.tasks, return_exceptions=True)
+            )
+        self.loop.close()
+
+    def close(self):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def accept(self, reader, writer):
+        task = asyncio.ensure_future(self.handle(reader, writer))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def handle(self, reader, writer):
+        writer.get_extra_info("socket").setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+        )
+        print("Client connected:", writer.get_extra_info("peername"))
+        decoder = Decoder()
+        binary = False
+        try:
+            while True:
+                # Legacy ASCII clients do not heartbeat, never time them out
+                timeout = self.timeout if binary else None
+                data = await asyncio.wait_for(reader.read(1024), timeout)
+                if not data:
+                    break
+                received, wall = monotonic(), time()
+                messages = decoder.feed(data)
+                if self.latency is not None:
+                    self.record(messages, received, wall)
+                for kind, value in messages:
+                    if kind == HELLO:
+                        binary = True
+                        self.clients.add(writer)
+                        writer.write(encode_hello())
+                    elif kind == HEARTBEAT:
+                        writer.write(encode_frame(HEARTBEAT))
+                    else:
+                        self.dispatch(kind, value)
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+            print("Client disconnected:", writer.get_extra_info("peername"))
+
+    def record(self, messages, received, wall):
+        self.latency.record("parse", monotonic() - received)
+        for kind, value in messages:
+            if kind in (SETPOINT, WAYPOINT) and value.timestamp is not None:
+                self.latency.record("network", wall - value.timestamp)
+
+    def dispatch(self, kind, value):
+        self.handler(kind, value)
+
+    def send(self, data):
+        """Sends data to every binary client, ASCII clients never read"""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.broadcast, data)
+
+    def broadcast(self, data):
+        for writer in self.clients:
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                self.dropped += 1
+            else:
+                writer.write(data)
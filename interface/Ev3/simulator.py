@@ -0,0 +1,199 @@
+"""
+Simulated Ev3, runs main.py on a normal Linux box without the brick.
+
+The motors move toward their target at the speed given by Robot.move
+(SpeedPercent of the motor max speed), so the measured positions sent back
+as telemetry lag the setpoints like the real arm. The server can add a
+network delay and drop setpoints. Run it headless:
+
+    python Ev3/simulator.py --port 12345 --delay 0.01 --loss 0.05
+
+or from a test or benchmark:
+
+    with Simulator(port=0) as sim:
+        client = Ev3Client("localhost", sim.port)
+        client.connect()
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import types
+from time import monotonic
+
+# main.py and its modules import each other as top level modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_ev3dev2 import OUTPUT_A, OUTPUT_B, OUTPUT_C, OUTPUT_D, SpeedDPS, SpeedPercent
+from latency import LatencyRecorder
+from protocol import SETPOINT
+from server import Ev3Server
+
+
+class SimulatedMotor:
+    """Tacho motor moving at constant speed toward the last target"""
+
+    max_speed = 1050  # deg/s at SpeedPercent(100)
+
+    def __init__(self, address):
+        self.address = address
+        self.start = 0.0  # Position (deg) when the current move started
+        self.target = 0.0
+        self.speed = 0.0  # deg/s
+        self.time = monotonic()
+
+    def current(self, now=None):
+        elapsed = (monotonic() if now is None else now) - self.time
+        travel = self.target - self.start
+        if abs(travel) <= self.speed * elapsed:
+            return self.target
+        return self.start + (self.speed * elapsed if travel > 0 else -self.speed * elapsed)
+
+    @property
+    def position(self):
+        return int(round(self.current()))
+
+    @position.setter
+    def position(self, value):
+        self.start = self.target = value
+        self.time = monotonic()
+
+    def speed_dps(self, speed):
+        if isinstance(speed, SpeedPercent):
+            return self.max_speed * speed.value / 100
+        if isinstance(speed, SpeedDPS):
+            return speed.value
+        return self.max_speed * speed / 100
+
+    def on_to_position(self, speed, position, brake=True, block=True):
+        now = monotonic()
+        self.start = self.current(now)
+        self.time = now
+        self.target = position
+        self.speed = min(abs(self.speed_dps(speed)), self.max_speed)
+
+    def run_direct(self, duty_cycle_sp=0):
+        pass
+
+    def wait_until(self, state):
+        pass
+
+    def stop(self, stop_action="brake"):
+        self.position = self.current()
+
+
+class LargeMotor(SimulatedMotor):
+    max_speed = 1050
+
+
+class MediumMotor(SimulatedMotor):
+    max_speed = 1560
+
+
+Motor = SimulatedMotor
+
+
+def install():
+    """Registers this module as ev3dev2.motor"""
+    module = types.ModuleType("ev3dev2.motor")
+    for name in ("OUTPUT_A", "OUTPUT_B", "OUTPUT_C", "OUTPUT_D", "SpeedPercent",
+                 "SpeedDPS", "LargeMotor", "MediumMotor", "Motor"):
+        setattr(module, name, globals()[name])
+    package = types.ModuleType("ev3dev2")
+    package.motor = module
+    sys.modules["ev3dev2"] = package
+    sys.modules["ev3dev2.motor"] = module
+
+
+class SimulatedServer(Ev3Server):
+    """
+    Ev3Server with a one way network delay (seconds) on received commands
+    and sent messages, and a probability of losing each received setpoint.
+    Heartbeats are answered at once.
+    """
+
+    def __init__(self, host, port, handler=None, timeout=3.0, delay=0.0, loss=0.0, seed=None):
+        Ev3Server.__init__(self, host, port, handler, timeout)
+        self.delay = delay
+        self.loss = loss
+        self.lost = 0
+        self.random = random.Random(seed)
+
+    def dispatch(self, kind, value):
+        if kind == SETPOINT and self.random.random() < self.loss:
+            self.lost += 1
+            return
+        if self.delay > 0:
+            self.loop.call_later(self.delay, Ev3Server.dispatch, self, kind, value)
+        else:
+            Ev3Server.dispatch(self, kind, value)
+
+    def send(self, data):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.loop.call_later, self.delay, self.broadcast, data)
+
+
+class Simulator:
+    """Runs main.run with simulated motors in a background thread"""
+
+    def __init__(self, host="localhost", port=0, delay=0.0, loss=0.0, seed=None):
+        install()
+        from main import run
+        from Robot import Robot
+
+        self.run = run
+        self.robot = Robot()
+        self.server = SimulatedServer(host, port, delay=delay, loss=loss, seed=seed)
+        self.latency = LatencyRecorder()  # Stages measured on the Ev3 side
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.statistics = None
+
+    @property
+    def port(self):
+        return self.server.port
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        self.server.ready.wait()
+        return self
+
+    def serve(self):
+        self.statistics = self.run(
+            self.robot, self.server, self.stop_event, self.latency
+        )
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--delay", type=float, default=0.0, help="one way delay (s)")
+    parser.add_argument("--loss", type=float, default=0.0, help="setpoint loss probability")
+    parser.add_argument("--latency-file", default=None, help="latency histograms (JSON)")
+    args = parser.parse_args()
+
+    install()
+    from main import run
+    from Robot import Robot
+
+    server = SimulatedServer(args.host, args.port, delay=args.delay, loss=args.loss)
+    run(Robot(), server, latency_file=args.latency_file)
+
+
+if __name__ == "__main__":
+    main()
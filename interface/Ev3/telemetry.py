@@ -0,0 +1,66 @@
+"""
+Telemetry received from the Ev3, kept on the interface side.
+
+The latest measurement is a single immutable tuple replaced at once, so
+readers never need a lock. The history is a preallocated ring buffer
+written only by the connection thread.
+"""
+
+from time import monotonic
+
+import numpy as np
+
+from Ev3.protocol import NO_SEQ
+
+# Columns of the history
+COLUMNS = ["received", "ev3_time", "setpoint_seq", "j1", "j2", "j3", "j4",
+           "latency", "e1", "e2", "e3", "e4"]
+
+
+class TelemetryBuffer:
+
+    def __init__(self, size: int = 4096):
+        self.latest = None      # (received, Telemetry), replaced atomically
+        self.history_buffer = np.full((size, len(COLUMNS)), np.nan)
+        self.count = 0          # Messages received, the ring index is count % size
+        self.last_seq = NO_SEQ
+
+        # Sent setpoints by seq, to relate each measurement to its command
+        self.sent_buffer = np.full((size, 6), np.nan)  # seq, sent time, j1..j4
+
+    def record_setpoint(self, seq: int, joints: tuple) -> None:
+        self.sent_buffer[seq % len(self.sent_buffer)] = (seq, monotonic(), *joints)
+
+    def add(self, telemetry) -> None:
+
+        """
+            Store a measurement. Tracking error is against the last executed
+            setpoint and latency goes from sending it to receiving the first
+            measurement reporting it; both are NaN when unknown
+        """
+
+        received = monotonic()
+        row = self.history_buffer[self.count % len(self.history_buffer)]
+        row[:] = np.nan
+        row[:7] = (received, telemetry.timestamp, telemetry.setpoint_seq, *telemetry.joints)
+
+        if telemetry.setpoint_seq != NO_SEQ:
+            sent = self.sent_buffer[telemetry.setpoint_seq % len(self.sent_buffer)]
+            if sent[0] == telemetry.setpoint_seq:
+                if telemetry.setpoint_seq != self.last_seq:
+                    row[7] = received - sent[1]
+                row[8:] = row[3:7] - sent[2:]
+        self.last_seq = telemetry.setpoint_seq
+
+        self.count += 1
+        self.latest = (received, telemetry)
+
+    def history(self) -> np.ndarray:
+
+        """ Copy of the stored measurements, oldest first (see COLUMNS) """
+
+        size = len(self.history_buffer)
+        if self.count <= size:
+            return self.history_buffer[:self.count].copy()
+        start = self.count % size
+        return np.concatenate([self.history_buffer[start:], self.history_buffer[:start]])
@@ -0,0 +1,89 @@
+"""
+Tests of the wire protocol decoder.
+
+Runs on the PC only (not copied to the brick):
+
+    python -m pytest Ev3/test_protocol.py    (from the interface folder)
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Ev3.protocol import (
+    ABORT,
+    HEADER,
+    HEARTBEAT,
+    MAGIC,
+    SETPOINT,
+    TELEMETRY,
+    TRAJECTORY,
+    VERSION,
+    WAYPOINT,
+    Decoder,
+    encode_abort,
+    encode_ascii,
+    encode_frame,
+    encode_setpoint,
+    encode_telemetry,
+    encode_trajectory,
+)
+
+
+def test_partial_reads_wait_for_the_whole_frame():
+    frame = encode_setpoint(7, 1.5, (1.0, 2.0, 3.0, 4.0))
+    decoder = Decoder()
+    for byte in frame[:-1]:
+        assert decoder.feed(bytes([byte])) == []
+    ((kind, setpoint),) = decoder.feed(frame[-1:])
+    assert kind == SETPOINT
+    assert (setpoint.seq, setpoint.timestamp, setpoint.joints) == (7, 1.5, [1.0, 2.0, 3.0, 4.0])
+    assert decoder.errors == 0
+    assert not decoder.buffer
+
+
+def test_merged_reads_are_decoded_entirely():
+    data = (
+        encode_setpoint(1, 0.0, (1, 2, 3, 4), WAYPOINT)
+        + encode_ascii((5, 6, 7, 8))
+        + encode_trajectory(3, [(0, 1, 2, 3, 4), (0.1, 1, 2, 3, 4)])
+        + encode_telemetry(2, 0.5, 1, (1, 2, 3, 4))
+        + encode_abort()
+    )
+    messages = Decoder().feed(data)
+    assert [kind for kind, _ in messages] == [WAYPOINT, SETPOINT, TRAJECTORY, TELEMETRY, ABORT]
+    assert messages[1][1].seq is None
+    assert messages[1][1].joints == [5, 6, 7, 8]
+    assert messages[2][1].id == 3
+    assert len(messages[2][1].samples) == 2
+    assert messages[3][1].setpoint_seq == 1
+
+
+def test_ascii_without_newline_ends_at_the_next_message():
+    decoder = Decoder()
+    assert decoder.feed(b"#1;2;3;4") == []
+    messages = decoder.feed(b"#5;6;7;8\n")
+    assert [value.joints for _, value in messages] == [[1, 2, 3, 4], [5, 6, 7, 8]]
+
+
+@pytest.mark.parametrize(
+    "corrupted",
+    [
+        b"garbage",
+        b"#1;2;3\n",  # Three joints
+        HEADER.pack(MAGIC, VERSION + 1, HEARTBEAT, 0),  # Unknown version
+        encode_frame(SETPOINT, b"\x00" * 3),  # Payload of the wrong size
+        b"R#1;x;3;4\n",  # Lone magic byte and an unparsable number
+    ],
+    ids=["garbage", "ascii joints", "version", "payload size", "mixed"],
+)
+def test_corruption_is_skipped_and_counted(corrupted):
+    decoder = Decoder()
+    frame = encode_setpoint(9, 0.0, (1, 2, 3, 4))
+    messages = decoder.feed(corrupted + frame)
+    assert [(kind, value.seq) for kind, value in messages] == [(SETPOINT, 9)]
+    assert decoder.errors >= 1
+    assert not decoder.buffer
@@ -0,0 +1,125 @@
+"""
+End to end test of the command pipeline against the simulated Ev3.
+
+Runs on the PC only (not copied to the brick):
+
+    python -m pytest Ev3/test_simulator.py    (from the interface folder)
+"""
+
+import os
+import sys
+import threading
+from time import monotonic, sleep
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Ev3.client import Ev3Client
+from Ev3.server import Ev3Server
+from Ev3.simulator import Simulator
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        if condition():
+            return True
+        sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def connection():
+    with Simulator(port=0) as sim:
+        client = Ev3Client("localhost", sim.port)
+        assert client.connect()
+        try:
+            yield sim, client
+        finally:
+            client.close()
+
+
+def test_move_is_reported_by_telemetry(connection):
+    sim, client = connection
+    assert client.binary
+    client.set_telemetry_rate(50)
+
+    target = (10.0, -5.0, 8.0, 3.0)
+    client.set_position(*target, must_execute=True)
+
+    def reached():
+        latest = client.telemetry.latest
+        return latest is not None and all(
+            abs(measured - sent) <= 1 for measured, sent in zip(latest[1].joints, target)
+        )
+
+    assert wait_for(reached), "telemetry %s" % (client.telemetry.latest,)
+    assert client.telemetry.latest[1].setpoint_seq == client.seq - 1
+    assert all(abs(m - t) <= 1 for m, t in zip(sim.robot.get_positions(), target))
+    assert sim.server.lost == 0
+
+
+def test_commands_are_dropped_while_disconnected():
+    with Simulator(port=0) as sim:
+        port = sim.port
+    client = Ev3Client("localhost", port, send_timeout=0.5)
+    try:
+        start = monotonic()
+        for i in range(300):
+            client.set_position(i, 0, 0, 0)
+        assert monotonic() - start < 0.5
+        assert client.discarded == 300
+        assert client.queue.qsize() == 0
+    finally:
+        client.close()
+
+
+def test_setpoint_numbers_are_unique_across_threads():
+    with Simulator(port=0) as sim:
+        port = sim.port
+    client = Ev3Client("localhost", port)
+    numbers = []
+    submit = client.submit
+
+    def record(kind, payload):
+        numbers.append(payload[0])
+        sleep(0)  # Let the other threads run in between
+        return submit(kind, payload)
+
+    client.submit = record
+    threads = [
+        threading.Thread(target=lambda: [client.set_position(0, 0, 0, 0) for _ in range(200)])
+        for _ in range(8)
+    ]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        client.close()
+    assert numbers == list(range(1600))
+    assert client.seq == 1600
+
+
+def test_slow_clients_lose_messages():
+    class Writer:
+        def __init__(self, buffered):
+            self.transport = self
+            self.buffered = buffered
+            self.written = []
+
+        def get_write_buffer_size(self):
+            return self.buffered
+
+        def write(self, data):
+            self.written.append(data)
+
+    server = Ev3Server("localhost", 0, max_buffer=1024)
+    fast, slow = Writer(0), Writer(4096)
+    server.clients.update((fast, slow))
+    server.broadcast(b"telemetry")
+    assert fast.written == [b"telemetry"]
+    assert slow.written == []
+    assert server.dropped == 1
@@ -5,16 +5,17 @@ from PyQt5.QtCore import *
 
 # Robot libraries
 from robot_control.control import RobotControl
+from robot_math.DH import joint_ranges
 
 # Other libraries
-import threading
 from math import degrees, radians, pi
-from time import sleep
 
 
 class GuiRobo(QMainWindow):
 
-    
+    # Robot state changes, emitted by the robot notifier thread
+    state_changed = pyqtSignal(object)
+
     def __init__(self):
         QMainWindow.__init__(self)
         loadUi("./gui/gui.ui", self)
@@ -23,11 +24,10 @@ class GuiRobo(QMainWindow):
         # Initialize the robot
         self.robot = RobotControl()
 
-        # Initialize simulation plot
-        self.mpl_widget.real_time(self.robot.get_all_joints_position)
-
-        # Initialize label updater
-        self.label_thread_start()
+        # Simulation plot and labels follow the robot state, on the GUI thread
+        self.state_changed.connect(self.update_state)
+        self.robot.subscribe(self.state_changed.emit)
+        self.update_state(self.robot.get_state())
 
         # Joystick buttons
         self.btn_up.pressed.connect(lambda: self.joystick("up"))
@@ -66,22 +66,46 @@ class GuiRobo(QMainWindow):
 
 
     def update_simulation(self):
-        th = threading.Thread(target=lambda: self.mpl_widget.plot(*self.robot.get_all_joints_position()))
-        th.start()
+        self.mpl_widget.plot(*self.robot.get_all_joints_position())
+
+
+    def update_state(self, state: dict):
+
+        # Update (x,y,z) manipulator position
+        x, y, z = state["manipulator_position"]
+        self.lb_x.setText("%.2f" % x)
+        self.lb_y.setText("%.2f" % y)
+        self.lb_z.setText("%.2f" % z)
+
+        # Update joints angles
+        j1, j2, j3, j4 = state["joint_angles"]
+        self.lb_j1.setText("%.1f°" % degrees(j1))
+        self.lb_j2.setText("%.1f°" % degrees(j2))
+        self.lb_j3.setText("%.1f°" % degrees(j3))
+        self.lb_claw.setText("%.1f°" % j4)
+
+        # Update simulation plot, redrawn only if the arm moved
+        self.mpl_widget.plot(*state["all_joints_position"])
 
 
     def save_trajectory(self):
         name = self.le_trajectory_name.text()
         if name != "":
-            if self.robot.save_trajectory(name):
-                self.browser.append("Trajectory %s saved!" % name)
+            try:
+                if self.robot.save_trajectory(name):
+                    self.browser.append("Trajectory %s saved!" % name)
+            except (OSError, ValueError) as error:
+                self.browser.append("Trajectory %s not saved: %s" % (name, error))
 
 
     def load_trajectory(self):
         name = self.le_trajectory_name.text()
         if name != "":
-            if self.robot.load_trajectory(name):
-                self.browser.append("Trajectory %s loaded!" % name)
+            try:
+                if self.robot.load_trajectory(name):
+                    self.browser.append("Trajectory %s loaded!" % name)
+            except (OSError, ValueError) as error:
+                self.browser.append("Trajectory %s not loaded: %s" % (name, error))
 
 
     def remove_trajectory(self):
@@ -109,7 +133,16 @@ class GuiRobo(QMainWindow):
 
 
     def run_trajectory(self):
-        self.robot.run_trajectory()
+        try:
+            started = self.robot.run_trajectory()
+        except ValueError as error:
+            self.browser.append("Trajectory not run: %s" % error)
+            return
+        if not started and self.robot.last_validation is not None \
+                and not self.robot.last_validation["valid"]:
+            report = self.robot.last_validation
+            self.browser.append("Trajectory rejected: %s at %.2f s"
+                                % (", ".join(report["reason"]), report["time"]))
 
 
     def joystick(self, button: str):
@@ -143,51 +176,22 @@ class GuiRobo(QMainWindow):
         # Get the current joints
         j1, j2, j3, j4 = self.robot.get_joint_angles()
 
+        # Shoulder and elbow stay within the ranges trajectories are checked against
+        (_, _), (j2_min, j2_max), (j3_min, j3_max) = joint_ranges
+
         if button == "up_j1" and -2*pi < j1 < 2*pi:
             self.robot.set_joint_angles(j1 + step, j2, j3, j4)
         elif button == "down_j1" and -2*pi < j1 < 2*pi:
             self.robot.set_joint_angles(j1 - step, j2, j3, j4)
-        if button == "up_j2" and -2*pi < j2 < 2*pi:
-            self.robot.set_joint_angles(j1, j2 + step, j3, j4)
-        elif button == "down_j2" and -2*pi < j2 < 2*pi:
-            self.robot.set_joint_angles(j1, j2 - step, j3, j4)
-        if button == "up_j3" and -2*pi < j3 < 2*pi:
-            self.robot.set_joint_angles(j1, j2, j3 + step, j4)
-        elif button == "down_j3" and -2*pi < j3 < 2*pi:
-            self.robot.set_joint_angles(j1, j2, j3 - step, j4)
-
-
-    def label_thread_start(self):
-        self.label_updater_thread = QThread()
-        self.label_worker = LabelUpdater(self)
-        self.label_worker.moveToThread(self.label_updater_thread)
-        self.label_updater_thread.started.connect(self.label_worker.run)
-        self.label_updater_thread.start()
-
-
-class LabelUpdater(QObject):
-
-    def __init__(self, gui: GuiRobo):
-        super().__init__()
-        self.gui = gui
-
-    def run(self):
-        while True:
-
-            # Update (x,y,z) manipulator position
-            x, y, z = self.gui.robot.get_manipulator_position()
-            self.gui.lb_x.setText("%.2f" % x)
-            self.gui.lb_y.setText("%.2f" % y)
-            self.gui.lb_z.setText("%.2f" % z)
-
-            # Update joints angles
-            j1, j2, j3, j4 = self.gui.robot.get_joint_angles()
-            self.gui.lb_j1.setText("%.1f°" % degrees(j1))
-            self.gui.lb_j2.setText("%.1f°" % degrees(j2))
-            self.gui.lb_j3.setText("%.1f°" % degrees(j3))
-            self.gui.lb_claw.setText("%.1f°" % j4)
-
-            sleep(0.5)
+        if button == "up_j2" and j2 < j2_max:
+            self.robot.set_joint_angles(j1, min(j2 + step, j2_max), j3, j4)
+        elif button == "down_j2" and j2 > j2_min:
+            self.robot.set_joint_angles(j1, max(j2 - step, j2_min), j3, j4)
+        if button == "up_j3" and j3 < j3_max:
+            self.robot.set_joint_angles(j1, j2, min(j3 + step, j3_max), j4)
+        elif button == "down_j3" and j3 > j3_min:
+            self.robot.set_joint_angles(j1, j2, max(j3 - step, j3_min), j4)
+
 
 
 app = QApplication([])
@@ -0,0 +1,80 @@
+"""
+Throughput and latency of the whole command pipeline against the simulator.
+
+An Ev3Client streams setpoints at a fixed rate to Ev3/simulator.py (the
+real main.py with simulated motors) and the closed-loop latency is taken
+from the telemetry: from sending a setpoint to receiving the first
+measurement reporting it as executed. The per stage histograms of both
+sides (Ev3/latency.py) are printed, and saved as JSON with --output.
+
+Usage (from the interface folder):
+    python benchmarks/pipeline.py [rate_hz] [seconds] [delay_s] [loss] [-o latency.json]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from time import perf_counter, sleep
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from Ev3.client import Ev3Client
+from Ev3.simulator import Simulator
+from Ev3.telemetry import COLUMNS
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("rate", nargs="?", type=float, default=50, help="setpoints per second")
+    parser.add_argument("seconds", nargs="?", type=float, default=5)
+    parser.add_argument("delay", nargs="?", type=float, default=0.0,
+                        help="one way network delay (s)")
+    parser.add_argument("loss", nargs="?", type=float, default=0.0,
+                        help="probability of losing a setpoint")
+    parser.add_argument("-o", "--output", help="save the stage histograms to this JSON file")
+    args = parser.parse_args()
+    rate, seconds, delay, loss = args.rate, args.seconds, args.delay, args.loss
+
+    with Simulator(delay=delay, loss=loss, seed=0) as sim:
+        client = Ev3Client("localhost", sim.port)
+        client.connect()
+        client.set_telemetry_rate(50)
+
+        n = int(rate*seconds)
+        t = np.arange(n)/rate
+        start = perf_counter()
+        for i in range(n):
+            client.set_position(30*np.sin(t[i]), 20*np.sin(t[i]), 20*np.cos(t[i]), 0)
+            sleep(max(0, start + t[i] + 1/rate - perf_counter()))
+        elapsed = perf_counter() - start
+        sleep(0.5 + 2*delay)
+
+        history = client.telemetry.history()
+        client.close()
+
+    latency = history[:, COLUMNS.index("latency")]
+    latency = latency[~np.isnan(latency)]*1e3
+    error = np.abs(history[:, COLUMNS.index("e1"):])
+
+    print(f"sent {client.sent} setpoints in {elapsed:.2f} s ({client.sent/elapsed:.0f}/s), "
+          f"lost {sim.server.lost}, Ev3 {sim.statistics}")
+    if len(latency):
+        print(f"latency ms: p50 {np.percentile(latency, 50):.1f} "
+              f"p99 {np.percentile(latency, 99):.1f} max {latency.max():.1f} "
+              f"({len(latency)} samples)")
+    print(f"max tracking error deg: {np.round(np.nanmax(error, axis=0), 2)}")
+    print("interface stages:", client.latency.report(), sep="\n")
+    print("Ev3 stages:", sim.latency.report(), sep="\n")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"interface": client.latency.summary(), "ev3": sim.latency.summary()},
+                      f, indent=2)
+        print(f"saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
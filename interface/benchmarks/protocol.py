@@ -0,0 +1,86 @@
+"""
+Throughput of the Ev3 wire protocol, binary frames against legacy ASCII.
+
+For each format it measures encoding, decoding (fed in 1024 byte reads, as
+the Ev3 does) and a localhost socket round trip, reporting messages/s and
+bytes per message.
+
+Usage (from the interface folder):
+    python benchmarks/protocol.py [messages]
+"""
+
+import socket
+import sys
+import threading
+from pathlib import Path
+from time import perf_counter, time
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from Ev3.protocol import Decoder, encode_ascii, encode_setpoint
+
+FORMATS = {
+    "binary": lambda i, joints: encode_setpoint(i, time(), joints),
+    "ascii": lambda i, joints: encode_ascii(joints),
+}
+
+
+def decode_all(decoder, data, read_size=1024):
+    decoded = 0
+    for i in range(0, len(data), read_size):
+        decoded += len(decoder.feed(data[i : i + read_size]))
+    return decoded
+
+
+def over_socket(messages):
+    sender, receiver = socket.socketpair()
+    decoder = Decoder()
+
+    def send():
+        with sender:
+            for msg in messages:
+                sender.sendall(msg)
+
+    start = perf_counter()
+    thread = threading.Thread(target=send)
+    thread.start()
+    decoded = 0
+    with receiver:
+        while True:
+            data = receiver.recv(1024)
+            if not data:
+                break
+            decoded += len(decoder.feed(data))
+    thread.join()
+    return decoded, perf_counter() - start
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    joints = np.degrees(np.random.default_rng(0).uniform(-np.pi, np.pi, (n, 4)))
+    joints = [tuple(float(j) for j in row) for row in joints]
+
+    for name, encode in FORMATS.items():
+        start = perf_counter()
+        messages = [encode(i, q) for i, q in enumerate(joints)]
+        encoding = perf_counter() - start
+
+        data = b"".join(messages)
+        start = perf_counter()
+        decoded = decode_all(Decoder(), data)
+        decoding = perf_counter() - start
+        assert decoded == n
+
+        received, elapsed = over_socket(messages)
+        print(
+            f"{name:>6}: {len(data) / n:5.1f} bytes/msg, "
+            f"encode {n / encoding:10.0f} msg/s, "
+            f"decode {n / decoding:10.0f} msg/s, "
+            f"socket {received / elapsed:10.0f} msg/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Frame rate and CPU usage of the 3D arm view (matplotlibwidget).
+
+The previous renderer cleared the axes, recreated the artists and drew the
+whole canvas for every frame, even when the arm was still. The current one
+updates the artists in place and blits them over a cached background, only
+when the points change. Both are driven as fast as possible with a moving
+arm, then for a while with a still arm (50 Hz polling, as the former
+Animation worker did).
+
+Usage (from the interface folder, no display needed):
+    QT_QPA_PLATFORM=offscreen python benchmarks/renderer.py [frames]
+"""
+
+import sys
+from pathlib import Path
+from time import perf_counter, process_time, sleep
+
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Before matplotlib, which only takes the Qt backend with a running app
+app = QApplication([])
+
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+from matplotlib.figure import Figure
+
+from matplotlibwidget import matplotlibwidget
+from robot_math.DH import DH
+
+
+def previous_plot(canvas, x, y, z):
+    axes = canvas.axes
+    axes.cla()
+    axes.plot(x, y, z, c="C0")
+    axes.scatter(x, y, z, color="C1", alpha=1)
+    axes.set_xlim(-300, 300)
+    axes.set_ylim(-300, 300)
+    axes.set_zlim(0, 300)
+    axes.tick_params(left = False, right = False,
+        labelleft = False, labelbottom = False, bottom = False)
+    axes.relim()
+    axes.autoscale_view()
+    canvas.draw()
+
+
+def measure(app, frames, step):
+    wall, cpu = perf_counter(), process_time()
+    for i in range(frames):
+        step(i)
+        app.processEvents()
+    wall, cpu = perf_counter() - wall, process_time() - cpu
+    return frames/wall, cpu/wall
+
+
+def main() -> None:
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    dh = DH()
+
+    # Arm sweeping the base and the shoulder
+    t = np.linspace(0, 2*np.pi, frames)
+    q = np.column_stack([t, 0.3*np.sin(t), 0.5*np.cos(t)])
+    points = [tuple(p.T) for p in dh.fw_kinematics_batch(q)]
+
+    widget = matplotlibwidget()
+    widget.resize(640, 480)
+    widget.show()
+    app.processEvents()
+    widget.canvas.draw()
+
+    # Same figure as the widget, for the previous renderer
+    canvas = FigureCanvasQTAgg(Figure(dpi=90, constrained_layout=True))
+    canvas.axes = canvas.figure.add_subplot(111, projection="3d")
+    canvas.resize(640, 480)
+    canvas.show()
+
+    moving = {
+        "previous": measure(app, frames, lambda i: previous_plot(canvas, *points[i])),
+        "blitting": measure(app, frames, lambda i: widget.plot(*points[i])),
+    }
+
+    # Still arm, the same points every 20 ms
+    still = {
+        "previous": measure(app, 50, lambda i: (previous_plot(canvas, *points[0]), sleep(0.02))),
+        "blitting": measure(app, 50, lambda i: (widget.plot(*points[0]), sleep(0.02))),
+    }
+
+    for name in moving:
+        print(f"{name:>8}: moving {moving[name][0]:7.1f} fps, {moving[name][1]*100:5.1f}% CPU; "
+              f"still {still[name][1]*100:5.1f}% CPU")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Per-command latency of Robot.move against the fake ev3dev2 backend.
+
+Compares the current move (targets cached, no motor read) with the
+previous behaviour of reading the four motor positions on every command,
+reproduced by polling before each move.
+
+Usage (from the interface folder):
+    python benchmarks/robot_move.py [commands]
+"""
+
+import sys
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Ev3"))
+
+import fake_ev3dev2
+
+fake_ev3dev2.install()
+
+from Robot import Robot
+
+
+def run(robot, commands, poll_each):
+    reads = sum(m.motor.reads for m in robot.motors)
+    start = perf_counter()
+    for q in commands:
+        if poll_each:
+            robot.poll()
+        robot.move(*q)
+    elapsed = perf_counter() - start
+    reads = sum(m.motor.reads for m in robot.motors) - reads
+    return elapsed, reads
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    t = np.linspace(0, 2 * np.pi, n)
+    commands = np.column_stack([90 * np.sin(t), 30 * t, -20 * t, 10 * np.cos(t)])
+
+    for name, poll_each in (("read per command", True), ("cached", False)):
+        elapsed, reads = run(Robot(), commands, poll_each)
+        print(
+            f"{name:>16}: {elapsed / n * 1e6:8.1f} us/command, "
+            f"{reads / n:4.1f} motor reads/command"
+        )
+
+
+if __name__ == "__main__":
+    main()
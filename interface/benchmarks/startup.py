@@ -0,0 +1,56 @@
+"""
+Startup time of the kinematics: `import robot_math.DH; DH()`.
+
+Each measurement runs in a fresh interpreter. The cold run deletes the
+generated kinematics cache first, so it includes the sympy derivation; the
+warm runs load the cached NumPy code and must not import sympy at all.
+
+Usage (from the interface folder):
+    python benchmarks/startup.py [repetitions]
+"""
+
+import json
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+INTERFACE = Path(__file__).resolve().parent.parent
+
+SNIPPET = """
+import json, sys
+from time import perf_counter
+start = perf_counter()
+import robot_math.DH
+robot_math.DH.DH()
+elapsed = perf_counter() - start
+print(json.dumps({"seconds": elapsed, "sympy": "sympy" in sys.modules}))
+"""
+
+
+def measure():
+    output = subprocess.run(
+        [sys.executable, "-c", SNIPPET],
+        cwd=INTERFACE,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output)
+
+
+def main() -> None:
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    shutil.rmtree(INTERFACE / "robot_math" / "kinematics_cache", ignore_errors=True)
+    cold = measure()
+    warm = [measure() for _ in range(repetitions)]
+
+    best = min(result["seconds"] for result in warm)
+    print(f"cold (sympy derivation): {cold['seconds'] * 1e3:8.1f} ms")
+    print(f"warm (cached, best of {repetitions}): {best * 1e3:8.1f} ms")
+    print(f"sympy imported when warm: {any(result['sympy'] for result in warm)}")
+
+
+if __name__ == "__main__":
+    main()
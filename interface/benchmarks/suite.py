@@ -0,0 +1,236 @@
+"""
+Benchmark suite of the kinematics, the trajectory generation, the wire
+protocol and the Ev3 motor commands, saved as JSON to compare commits.
+
+Cases run with fixed inputs and seeds, each timed as the best of several
+repetitions (timeit, garbage collector disabled). Needs no Ev3 nor GUI:
+the client talks to a local socket that never answers and Robot.move runs
+against the fake ev3dev2 backend (Ev3/fake_ev3dev2.py).
+
+Usage (from the interface folder):
+    python benchmarks/suite.py [-o results.json] [-k filter] [--compare old.json]
+"""
+
+import argparse
+import json
+import platform
+import socket
+import subprocess
+import sys
+import timeit
+from datetime import datetime, timezone
+from pathlib import Path
+
+INTERFACE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(INTERFACE))
+sys.path.insert(0, str(INTERFACE / "Ev3"))
+
+import numpy as np
+
+import fake_ev3dev2
+
+fake_ev3dev2.install()
+
+from Ev3.client import Ev3Client
+from Ev3.protocol import SETPOINT, Decoder, encode_ascii, encode_setpoint, parse
+from Robot import Robot
+from robot_control.control import PROFILE_PEAKS, RobotTrajectory
+from robot_math.DH import DH
+from robot_math.ik_cache import IKCache
+from startup import measure
+
+BENCHMARKS = {}
+
+
+def benchmark(function):
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def time_case(function, repeat):
+
+    """ Best time of one call, in seconds """
+
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number))/number
+
+
+def trajectory(points, seed=0):
+
+    """ Random waypoints, one second apart, in the format of the CSV files """
+
+    rng = np.random.default_rng(seed)
+    q = rng.uniform(-1, 1, (points, 4))*[np.pi, np.pi/2, 3*np.pi/4, 30]
+    return {"j1": q[:, 0], "j2": q[:, 1], "j3": q[:, 2], "j4": q[:, 3],
+            "si": np.zeros(points), "sf": np.zeros(points),
+            "time": np.arange(points, dtype=float)}
+
+
+# Cases, each yields (name, function, items processed per call)
+
+@benchmark
+def dh():
+    yield "construction (fresh interpreter)", None, 1
+    yield "construction", DH, 1
+
+
+@benchmark
+def kinematics():
+    dh = DH()
+    q = np.random.default_rng(0).uniform(-1, 1, (1000, 3))
+    targets = dh.last_pos_batch(q)
+    target, last = targets[0], q[0] + 0.05
+
+    yield "fw_kinematics", lambda: dh.fw_kinematics(q[0]), 1
+    yield "fw_kinematics_batch x1000", lambda: dh.fw_kinematics_batch(q), len(q)
+    yield "bw_kinematics", lambda: dh.bw_kinematics(target, last), 1
+    yield "numeric_bw_kinematics", lambda: dh.numeric_bw_kinematics(target, last), 1
+
+    cache = IKCache(dh)
+    cache.solve(target, last)
+    yield "IKCache.solve hit", lambda: cache.solve(target, last), 1
+
+
+@benchmark
+def sample():
+
+    """ RobotTrajectory.sample, as run by the app: interpolation, slow down to the limits, sampling """
+
+    generator = RobotTrajectory()
+    for profile in sorted(PROFILE_PEAKS):
+        for points in (10, 100):
+            waypoints = trajectory(points)
+            for rate in (10, 100):
+                samples = len(generator.sample(profile, rate, waypoints)[0])
+                yield (f"{profile} {points} points {rate} Hz",
+                       lambda p=profile, w=waypoints, r=rate: generator.sample(p, r, w), samples)
+
+
+@benchmark
+def protocol():
+
+    """ Client encoding and Ev3 decoding, 1000 messages per call """
+
+    joints = np.degrees(np.random.default_rng(0).uniform(-np.pi, np.pi, (1000, 4)))
+    joints = [tuple(float(j) for j in row) for row in joints]
+
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        client = Ev3Client("127.0.0.1", server.getsockname()[1], protocol="binary",
+                           heartbeat=3600)
+        try:
+            def encode():
+                return [client.encode(SETPOINT, (seq, q, None)) for seq, q in enumerate(joints)]
+
+            client.binary = True
+            binary = b"".join(encode())
+            yield "Ev3Client.encode binary", encode, len(joints)
+            client.binary = False
+            ascii = b"".join(encode())
+            yield "Ev3Client.encode ascii", encode, len(joints)
+        finally:
+            client.close()
+
+    messages = [encode_ascii(q) for q in joints]
+    yield "parse ascii", lambda: [parse(m) for m in messages], len(joints)
+    yield "Decoder.feed binary", lambda: Decoder().feed(binary), len(joints)
+    yield "Decoder.feed ascii", lambda: Decoder().feed(ascii), len(joints)
+    yield "encode_setpoint", lambda: [encode_setpoint(i, 0.0, q) for i, q in enumerate(joints)], \
+        len(joints)
+
+
+@benchmark
+def robot():
+
+    """ Robot.move against the fake backend, 100 commands per call """
+
+    t = np.linspace(0, 2*np.pi, 100)
+    moving = np.column_stack([90*np.sin(t), 30*t, -20*t, 10*np.cos(t)]).tolist()
+    still = [moving[0]]*len(moving)
+    robot = Robot()
+
+    def move(commands):
+        for q in commands:
+            robot.move(*q)
+
+    yield "Robot.move moving", lambda: move(moving), len(moving)
+    yield "Robot.move same target", lambda: move(still), len(still)
+
+
+# Running and comparing
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=INTERFACE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(pattern=None, repeat=5) -> dict:
+    results = {}
+    for group, cases in BENCHMARKS.items():
+        for name, function, items in cases():
+            key = f"{group}: {name}"
+            if pattern and pattern not in key:
+                continue
+            if function is None:    # Startup, each run in a new interpreter
+                seconds = min(measure()["seconds"] for _ in range(repeat))
+            else:
+                seconds = time_case(function, repeat)
+            results[key] = {"seconds": seconds, "items": items,
+                            "items_per_s": items/seconds}
+            print(f"{key:<48} {seconds*1e6:12.1f} us {items/seconds:14.0f} items/s")
+    return results
+
+
+def compare(results: dict, previous: dict, threshold: float) -> list:
+
+    """ Print the ratio of every case found in both and return the regressions """
+
+    regressions = []
+    print(f"\nagainst {previous['commit']} ({previous['date']}):")
+    for key, result in results.items():
+        if key not in previous["results"]:
+            continue
+        ratio = result["seconds"]/previous["results"][key]["seconds"]
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        elif ratio < 1/threshold:
+            flag = "  faster"
+        print(f"{key:<48} {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    parser.add_argument("-k", "--filter", help="run only the cases containing it")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--compare", help="results of a previous run")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    report = {
+        "commit":   git_commit(),
+        "date":     datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine":  {"python": platform.python_version(), "numpy": np.__version__,
+                     "platform": platform.platform(), "processor": platform.machine()},
+        "results":  run(args.filter, args.repeat),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if compare(report["results"], previous, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Load time of a trajectory, CSV (pandas) against the binary .rtj format.
+
+Cold runs load in a fresh interpreter, imports included, as when the GUI
+loads a trajectory for the first time; warm runs repeat the load in
+process. "ready to run" adds the sampling at 10 Hz, stored in the .rtj
+file and computed after loading the CSV.
+
+Usage (from the interface folder):
+    python benchmarks/trajectory_load.py [csv] [repetitions]
+"""
+
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+INTERFACE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(INTERFACE))
+
+import numpy as np
+import pandas as pd
+
+from robot_control import trajectory_file
+from robot_control.control import RobotTrajectory
+
+COLD = {
+    "csv": """
+import pandas as pd, numpy as np
+df = pd.read_csv(PATH)
+trajectory = {c: np.array(df[c]) for c in df.columns}
+""",
+    "rtj": """
+from robot_control import trajectory_file
+trajectory, samples, header = trajectory_file.load(PATH)
+""",
+}
+
+SNIPPET = """
+import json, sys
+from time import perf_counter
+start = perf_counter()
+{code}
+print(json.dumps(perf_counter() - start))
+"""
+
+
+def cold(kind, path):
+    code = COLD[kind].replace("PATH", repr(str(path)))
+    output = subprocess.run([sys.executable, "-c", SNIPPET.format(code=code)],
+                            cwd=INTERFACE, capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+
+def best(function, repetitions):
+    times = []
+    for _ in range(repetitions):
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    csv = Path(sys.argv[1]) if len(sys.argv) > 1 else INTERFACE / "final.csv"
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    with tempfile.TemporaryDirectory() as directory:
+        rtj = Path(directory) / csv.with_suffix(trajectory_file.SUFFIX).name
+        df = pd.read_csv(csv)
+        trajectory = {c: df[c].to_numpy(dtype=float) for c in trajectory_file.WAYPOINTS}
+        trajectory_file.save(rtj, trajectory, RobotTrajectory().sample("cubic", 10, trajectory),
+                             10, "cubic")
+        size = rtj.stat().st_size
+
+        def load_csv():
+            df = pd.read_csv(csv)
+            return {c: np.array(df[c]) for c in df.columns}
+
+        def run_csv():
+            return RobotTrajectory().sample("cubic", 10, load_csv())
+
+        results = {
+            "csv": (min(cold("csv", csv) for _ in range(3)), best(load_csv, repetitions),
+                    best(run_csv, repetitions)),
+            "rtj": (min(cold("rtj", rtj) for _ in range(3)),
+                    best(lambda: trajectory_file.load(rtj), repetitions),
+                    best(lambda: trajectory_file.load(rtj)[1], repetitions)),
+        }
+
+    print(f"{csv.name}: {len(df)} waypoints, {csv.stat().st_size} bytes as CSV, "
+          f"{size} bytes as .rtj with the samples")
+    for kind, (first, warm, ready) in results.items():
+        print(f"{kind}: cold {first*1e3:8.1f} ms, warm {warm*1e3:8.3f} ms, "
+              f"ready to run {ready*1e3:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Pre-flight validation of sampled trajectories (robot_control/control.py).
+
+A trajectory is sampled by RobotTrajectory.sample, as played, at
+increasing rates and validated in one vectorized pass: joint ranges, speed
+and acceleration with the EV3 limits, ground and self collision. Every
+check runs on a valid trajectory, none stops early. Prints the samples
+validated per millisecond and the first violation found, if any.
+
+Usage (from the interface folder):
+    python benchmarks/validation.py [csv] [repetitions] [profile]
+"""
+
+import sys
+from pathlib import Path
+from time import perf_counter
+
+INTERFACE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(INTERFACE))
+
+from robot_control.control import RobotTrajectory, ev3_joint_limits, validate_trajectory
+from robot_math.DH import DH
+
+
+def main() -> None:
+    csv = Path(sys.argv[1]) if len(sys.argv) > 1 else INTERFACE / "final.csv"
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    profile = sys.argv[3] if len(sys.argv) > 3 else "cubic_spline"
+
+    dh = DH()
+    max_speed, max_acceleration = ev3_joint_limits()
+    trajectory = RobotTrajectory()
+    trajectory.load_trajectory(str(csv))
+
+    for rate in (10, 100, 1000):
+        samples = trajectory.sample(profile, rate)
+        best = float("inf")
+        for _ in range(repetitions):
+            start = perf_counter()
+            report = validate_trajectory(dh, *samples, max_speed, max_acceleration)
+            best = min(best, perf_counter() - start)
+        n = len(samples[0])
+        result = "valid" if report["valid"] else \
+            f"{', '.join(report['reason'])} at sample {report['index']} ({report['time']:.2f} s)"
+        print(f"{rate:5d} Hz {n:7d} samples: {best*1e3:7.2f} ms, "
+              f"{n/(best*1e3):8.0f} samples/ms, {result}")
+
+
+if __name__ == "__main__":
+    main()
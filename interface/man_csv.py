@@ -3,27 +3,64 @@ This module provides functions for converting angles between radians and
 degrees, as well as saving and loading DataFrames to/from CSV files.
 
 Functions:
-    - rad2deg(df): Convert values in a DataFrame from radians to degrees.
-    - deg2rad(df): Convert values in a DataFrame from degrees to radians.
+    - rad2deg(df): Convert the angle columns of a DataFrame from radians to degrees.
+    - deg2rad(df): Convert the angle columns of a DataFrame from degrees to radians.
     - save_csv(df, name): Save a DataFrame to a CSV file.
     - load_csv(name): Load a DataFrame from a CSV file.
-    - main(): Main function demonstrating the usage of the provided functions.
+    - convert_file(source, destination, direction): Convert a CSV file in chunks.
+    - convert_files(patterns, direction): Convert many files in parallel.
+    - main(): Batch conversion from the command line.
+
+The schema gives the unit of each column in the trajectory format (by
+default robot_control.trajectory_file.UNITS) and only the columns in
+radians are converted: the claw (j4) is already commanded in degrees and
+si, sf and time are not angles.
+
+Usage:
+    python man_csv.py rad2deg 'trajectories/*.csv' -o converted [--workers 4]
+        [--unit j4=rad ...]
 """
 
 
+import argparse
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
 from pathlib import Path
+from time import perf_counter
+
 import numpy as np
 import pandas as pd
 
+from robot_control.trajectory_file import UNITS
+
+# Unit of each column, the columns in ANGLE_UNIT are the ones converted
+SCHEMA = dict(UNITS)
+ANGLE_UNIT = "rad"
+
+CONVERSIONS = {"rad2deg": np.rad2deg, "deg2rad": np.deg2rad}
+
 
-def rad2deg(df):
-    for c in df.columns:
-        df[c] = np.rad2deg(df[c])
+def angle_columns(columns, schema=None):
+    """Columns holding joint angles according to schema (column -> unit)"""
+    schema = SCHEMA if schema is None else schema
+    return [c for c in columns if schema.get(c) == ANGLE_UNIT]
 
 
-def deg2rad(df):
-    for c in df.columns:
-        df[c] = np.deg2rad(df[c])
+def convert(df, direction, columns=None, schema=None):
+    if columns is None:
+        columns = angle_columns(df.columns, schema)
+    for c in columns:
+        df[c] = CONVERSIONS[direction](df[c])
+
+
+def rad2deg(df, columns=None, schema=None):
+    convert(df, "rad2deg", columns, schema)
+
+
+def deg2rad(df, columns=None, schema=None):
+    convert(df, "deg2rad", columns, schema)
 
 
 def save_csv(df, name):
@@ -34,11 +71,105 @@ def load_csv(name):
     return pd.read_csv(Path(name).with_suffix(".csv"))
 
 
+def convert_file(source, destination, direction, chunksize=100_000, schema=None):
+    """Converts source into destination reading chunksize rows at a time,
+    returns the number of rows"""
+    rows = 0
+    header = True
+    temp = Path(destination).with_suffix(f".{os.getpid()}.tmp")
+    with open(temp, "w", newline="") as f:
+        for chunk in pd.read_csv(source, chunksize=chunksize):
+            convert(chunk, direction, schema=schema)
+            chunk.to_csv(f, index=False, header=header)
+            header = False
+            rows += len(chunk)
+        # Header only files may give no chunk at all
+        if header:
+            pd.read_csv(source, nrows=0).to_csv(f, index=False)
+    os.replace(temp, destination)
+    return rows
+
+
+def destination_of(source, direction, output_dir=None):
+    source = Path(source)
+    if output_dir is None:
+        return source.with_name(f"{source.stem}_{direction.split('2')[1]}{source.suffix}")
+    return Path(output_dir) / source.name
+
+
+def check_destinations(sources, destinations):
+    """Raises ValueError when two files would be written to the same path
+    or a file would be written over one being converted"""
+    resolved = [Path(d).resolve() for d in destinations]
+    collisions = sorted(str(d) for d, n in Counter(resolved).items() if n > 1)
+    if collisions:
+        raise ValueError(f"several inputs would be written to {', '.join(collisions)}")
+    overwritten = sorted(set(resolved) & {Path(s).resolve() for s in sources})
+    if overwritten:
+        raise ValueError(f"inputs would be overwritten: {', '.join(map(str, overwritten))}")
+
+
+def convert_files(
+    patterns, direction, output_dir=None, workers=None, chunksize=100_000, schema=None
+):
+    """Converts every file matching the patterns (globs), one process per
+    file, and returns the total rows and the rows/s"""
+    sources = sorted({name for pattern in patterns for name in glob(pattern) or [pattern]})
+    destinations = [destination_of(s, direction, output_dir) for s in sources]
+    check_destinations(sources, destinations)
+    if output_dir is not None:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    start = perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        rows = list(
+            pool.map(
+                convert_file,
+                sources,
+                destinations,
+                [direction] * len(sources),
+                [chunksize] * len(sources),
+                [schema] * len(sources),
+            )
+        )
+    elapsed = perf_counter() - start
+
+    for source, destination, n in zip(sources, destinations, rows):
+        print(f"{source} -> {destination} ({n} rows)")
+    return sum(rows), sum(rows) / elapsed if elapsed > 0 else float("inf")
+
+
 def main() -> None:
-    df = pd.DataFrame({"a": [3.14, 2 * 3.14]})
-    save_csv(df, "rad")
-    rad2deg(df)
-    save_csv(df, "deg")
+    parser = argparse.ArgumentParser(description="Convert the joint angles of trajectory CSVs")
+    parser.add_argument("direction", choices=sorted(CONVERSIONS))
+    parser.add_argument("patterns", nargs="+", help="files or globs")
+    parser.add_argument("-o", "--output-dir", help="default: next to each file, suffixed")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument(
+        "--unit",
+        action="append",
+        default=[],
+        metavar="COLUMN=UNIT",
+        help=f"override the unit of a column, columns in {ANGLE_UNIT} are converted "
+        f"(default {','.join(f'{c}={u}' for c, u in SCHEMA.items())})",
+    )
+    args = parser.parse_args()
+
+    schema = dict(SCHEMA)
+    for item in args.unit:
+        column, sep, unit = item.partition("=")
+        if not sep or not column:
+            parser.error(f"--unit expects COLUMN=UNIT, got {item!r}")
+        schema[column] = unit
+
+    try:
+        rows, rate = convert_files(
+            args.patterns, args.direction, args.output_dir, args.workers, args.chunksize, schema
+        )
+    except ValueError as error:
+        parser.error(str(error))
+    print(f"{rows} rows, {rate:.0f} rows/s")
 
 
 if __name__ == "__main__":
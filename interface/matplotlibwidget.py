@@ -13,23 +13,16 @@ from matplotlib.backends.backend_qt5agg import (NavigationToolbar2QT as Navigati
 matplotlib.use('Qt5Agg')
 
 
-class Animation(QObject):
-    
-    finished = pyqtSignal()
-
-    def __init__(self, plot, function):
-        super().__init__()
-        self.get_points = function
-        self.plot = plot
+class matplotlibwidget(QWidget):
 
-    def run(self):
-        while True:
-            self.plot(*self.get_points())
-            time.sleep(0.02)
+    """
+        3D view of the arm. The line and the joints are created once and
+        only their data changes; redraws are blitted over a cached
+        background, on the GUI thread, and only when the points change
+    """
 
+    points_changed = pyqtSignal(object, object, object)
 
-class matplotlibwidget(QWidget):
-    
     def __init__(self, parent=None):
         QWidget.__init__(self, parent)
         
@@ -55,32 +48,92 @@ class matplotlibwidget(QWidget):
         self.lines = []
         self.graphs = {}
 
-    def real_time(self, get_points) -> None:
-        self.thread = QThread()
-        self.worker = Animation(self.plot, get_points)
-        self.worker.moveToThread(self.thread)
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.thread.finished.connect(self.thread.deleteLater)
-        self.thread.start()
+        # Arm artists, drawn only by blit_frame()
+        axes = self.canvas.axes
+        axes.set_xlim(-300, 300)
+        axes.set_ylim(-300, 300)
+        axes.set_zlim(0, 300)
+        axes.tick_params(left = False, right = False,
+            labelleft = False, labelbottom = False, bottom = False)
+        self.arm, = axes.plot([], [], [], c="C0", animated=True)
+        self.joints = axes.scatter([], [], [], color="C1", alpha=1, animated=True)
+        self.points = None          # Last plotted (x, y, z)
+        self.background = None      # Canvas without the arm, see on_draw()
+        self.render_pending = False
+
+        # Rendering statistics
+        self.frames = 0
+        self.statistics_since = (time.perf_counter(), time.process_time())
+
+        # plot() may be called from any thread, blit_frame() runs in the GUI one
+        self.points_changed.connect(self.set_points)
+        self.canvas.mpl_connect("draw_event", self.on_draw)
 
     #
     def plot(self, x: list, y: list, z: list) -> None:
 
-        self.x_axis = x
-        self.y_axis = y
+        """ Show the arm at the points (x, y, z), from any thread """
 
-        self.canvas.axes.cla()
-        self.canvas.axes.plot(x, y, z, c="C0")
-        self.canvas.axes.scatter(x, y, z, color="C1", alpha=1)
-        self.canvas.axes.set_xlim(-300, 300)
-        self.canvas.axes.set_ylim(-300, 300)
-        self.canvas.axes.set_zlim(0, 300)
-        self.canvas.axes.tick_params(left = False, right = False, 
-            labelleft = False, labelbottom = False, bottom = False)
+        self.points_changed.emit(x, y, z)
 
-        self.updateDraw()
+    #
+    def set_points(self, x, y, z) -> None:
+        points = (tuple(x), tuple(y), tuple(z))
+        if points == self.points:
+            return
+        self.points = points
+
+        # Points arriving before the next frame replace these ones
+        if not self.render_pending:
+            self.render_pending = True
+            QTimer.singleShot(0, self.blit_frame)
+
+    #
+    def blit_frame(self) -> None:
+        self.render_pending = False
+        if self.points is None:
+            return
+        self.arm.set_data_3d(*self.points)
+        self.joints._offsets3d = self.points
+
+        # No background before the first full draw, it will draw the arm
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_arm()
+        self.canvas.blit(self.canvas.figure.bbox)
+
+    #
+    def draw_arm(self) -> None:
+        self.canvas.axes.draw_artist(self.arm)
+        self.canvas.axes.draw_artist(self.joints)
+        self.frames += 1
+
+    #
+    def on_draw(self, event) -> None:
+
+        """ Full redraws (resize, view rotation) renew the background """
+
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.draw_arm()
+
+    #
+    def render_statistics(self, reset: bool = True) -> dict:
+
+        """ Frames per second and CPU usage (fraction of a core) of the process """
+
+        wall, cpu = self.statistics_since
+        now = (time.perf_counter(), time.process_time())
+        statistics = {
+            "frames": self.frames,
+            "fps": self.frames/(now[0] - wall),
+            "cpu": (now[1] - cpu)/(now[0] - wall),
+        }
+        if reset:
+            self.frames = 0
+            self.statistics_since = now
+        return statistics
 
     #
     def update(self, x, y, labels):
@@ -1,20 +1,222 @@
 # Libraries
 import numpy as np
 import threading as th
+import queue
 import pandas as pd
-from datetime import datetime
+from scipy.interpolate import CubicSpline, PPoly
 
 # Robot communication
-from robot_math.DH import DH
+from robot_math.DH import DH, joint_ranges
+from robot_math.workspace import Workspace
+from robot_math.ik_cache import IKCache
+from robot_control import trajectory_file
 from Ev3.client import Ev3Client
 
 # Functions 
-from time import sleep
+from time import sleep, perf_counter
 from math import degrees, radians
+from pathlib import Path
 from pandas import isnull
 
 from env import HOST
 
+# Ev3 motors as configured in Ev3/Robot.py:
+# (max motor speed in deg/s, SpeedPercent used by Robot.move, reduction)
+EV3_JOINTS = {
+    "j1": (1050, 100, 24 * 2.5),           # Base, LargeMotor
+    "j2": (1050,  10, (40/24) * (40/8)),   # Shoulder, LargeMotor
+    "j3": (1560,  40, 40),                 # Elbow, MediumMotor
+    "j4": (1560,  20, 24),                 # Claw, MediumMotor
+}
+
+# Peak speed and acceleration of a rest to rest segment of each profile,
+# in units of displacement/duration and displacement/duration²
+PROFILE_PEAKS = {
+    "cubic":        (1.5,   6),
+    "quintic":      (1.875, 10/np.sqrt(3)),
+    "minimum_jerk": (1.875, 10/np.sqrt(3)),
+    "cubic_spline": (1.5,   6),
+}
+
+
+def ev3_joint_limits(ramp_time: float = 0.5) -> tuple:
+
+    """
+        Joint speed and acceleration limits reachable by the Ev3 motors,
+        in rad/s and rad/s² (deg/s and deg/s² for the claw). The motors are
+        assumed to reach their speed in ramp_time seconds
+    """
+
+    max_speed = np.array([speed*percent/100/reduction
+                          for speed, percent, reduction in EV3_JOINTS.values()])
+    max_speed[:3] = np.radians(max_speed[:3])
+    return max_speed, max_speed/ramp_time
+
+
+# Default limits of sampling and validation
+EV3_MAX_SPEED, EV3_MAX_ACCELERATION = ev3_joint_limits()
+
+
+def limits_key(max_speed, max_acceleration) -> tuple:
+
+    """ Hashable form of the joint limits, None for a disabled limit """
+
+    return tuple(None if limit is None else tuple(np.asarray(limit, dtype=float).tolist())
+                 for limit in (max_speed, max_acceleration))
+
+
+def sleep_until(deadline: float, spin: float = 5e-4) -> float:
+
+    """
+        Wait until the perf_counter() deadline, sleeping while it is far and
+        spinning only for the last spin seconds. Returns the wake up time
+    """
+
+    remaining = deadline - perf_counter()
+    if remaining > spin:
+        sleep(remaining - spin)
+    now = perf_counter()
+    while now < deadline:
+        now = perf_counter()
+    return now
+
+
+# Minimum distance (mm) between the forearm and the axis of the base column
+COLLISION_CLEARANCE = 40
+
+
+def axis_distance(r0: np.ndarray, z0: np.ndarray, r1: np.ndarray, z1: np.ndarray,
+                  height: float) -> np.ndarray:
+
+    """
+        Distance, in the plane of the arm, between the segments (r0, z0)-(r1, z1)
+        and the base column from (0, 0) to (0, height)
+    """
+
+    dr, dz = r1 - r0, z1 - z0
+    length = dr*dr + dz*dz
+
+    # Column ends to the segment (squared, a single square root at the end)
+    def to_segment(z):
+        u = np.clip((-r0*dr + (z - z0)*dz)/length, 0, 1)
+        r, h = r0 + u*dr, z0 + u*dz - z
+        return r*r + h*h
+
+    # Segment ends to the column
+    def to_column(r, z):
+        h = z - np.clip(z, 0, height)
+        return r*r + h*h
+
+    distance = np.minimum(np.minimum(to_segment(0.0), to_segment(height)),
+                          np.minimum(to_column(r0, z0), to_column(r1, z1)))
+
+    # Segments crossing the column
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = z0 - r0*dz/dr
+    distance[(r0*r1 <= 0) & (z >= 0) & (z <= height)] = 0
+    return np.sqrt(distance)
+
+
+def validate_trajectory(dh: DH, time, j1, j2, j3, j4, max_speed = EV3_MAX_SPEED,
+                        max_acceleration = EV3_MAX_ACCELERATION, ranges = joint_ranges,
+                        ground: float = 0, clearance: float = COLLISION_CLEARANCE) -> dict:
+
+    """
+        Checks a sampled trajectory in one vectorized pass: joint ranges
+        (joints whose range covers a whole turn are free), speed and
+        acceleration limits (None skips them), every joint above the
+        ground and the forearm away from the base column. Returns the
+        first violating sample index of each check and overall
+
+        Sample 0 is where the arm already is: a joint out of its range may
+        move back towards it, but never further out. Samples that do not
+        advance in time (repeated segment boundaries) are left out of the
+        derivatives, and flagged as speed violations if the joints jump
+        there
+    """
+
+    time = np.asarray(time, dtype=float)
+    q = np.array([j1, j2, j3, j4], dtype=float)     # One contiguous row per joint
+    checks = {}
+
+    def first(violations: np.ndarray):
+        index = np.flatnonzero(violations)
+        return int(index[0]) if len(index) else None
+
+    # Joint ranges, how far out of the range must never grow
+    ranges = np.asarray(ranges, dtype=float)
+    violations = np.zeros(len(time), dtype=bool)
+    for angles, (low, high) in zip(q, ranges):
+        if high - low < 2*np.pi:
+            excess = np.maximum(np.maximum(low - angles, angles - high), 0)
+            violations[1:] |= excess[1:] > excess[:-1] + 1e-9
+    checks["joint_range"] = first(violations)
+
+    # Samples advancing in time, the others are repeated boundaries
+    advancing = np.ones(len(time), dtype=bool)
+    advancing[1:] = time[1:] > np.maximum.accumulate(time)[:-1]
+    jumps = np.zeros(len(time), dtype=bool)
+    index = np.flatnonzero(advancing)
+    if len(index) < len(time):
+        jumps[1:] = ~advancing[1:] & (np.abs(np.diff(q, axis=1)) > 1e-9).any(axis=0)
+    t, qt = (time, q) if len(index) == len(time) else (time[index], q[:, index])
+
+    # Speed and acceleration, finite differences over the samples (the
+    # speed between samples i and i+1 is reported at i+1)
+    dt = np.diff(t)
+    speed = np.diff(qt, axis=1)
+    speed /= dt
+    acceleration = np.diff(speed, axis=1)
+    acceleration /= (dt[1:] + dt[:-1])/2
+    checks["speed"] = None
+    checks["acceleration"] = None
+    if max_speed is not None:
+        np.abs(speed, out=speed)
+        limit = np.asarray(max_speed, dtype=float)[:, None]*(1 + 1e-6)
+        violations = jumps.copy()
+        violations[index[1:]] |= (speed > limit).any(axis=0)
+        checks["speed"] = first(violations)
+    if max_acceleration is not None:
+        np.abs(acceleration, out=acceleration)
+        limit = np.asarray(max_acceleration, dtype=float)[:, None]*(1 + 1e-6)
+        violations = np.zeros(len(time), dtype=bool)
+        violations[index[1:-1]] = (acceleration > limit).any(axis=0)
+        checks["acceleration"] = first(violations)
+
+    # Ground and self collision, from the elbow and manipulator positions
+    # in the plane of the arm (batch FK without the base rotation)
+    r_elbow, z_elbow, r_end, z_end = dh.planar_batch(q[1], q[2])
+    checks["ground"] = first((z_elbow < ground) | (z_end < ground))
+    checks["self_collision"] = first(axis_distance(r_elbow, z_elbow, r_end, z_end, dh.d1) < clearance)
+
+    failed = {check: index for check, index in checks.items() if index is not None}
+    index = min(failed.values()) if failed else None
+    return {
+        "valid":  index is None,
+        "index":  index,
+        "time":   None if index is None else float(time[index]),
+        "reason": [check for check, i in failed.items() if i == index],
+        "checks": checks,
+    }
+
+
+def jitter_statistics(lateness: np.ndarray) -> dict:
+
+    """ Summary (in milliseconds) of how late each point was sent """
+
+    if len(lateness) == 0:
+        return {"points": 0}
+    lateness = lateness*1e3
+    return {
+        "points": len(lateness),
+        "mean_ms": float(np.mean(lateness)),
+        "std_ms":  float(np.std(lateness)),
+        "p50_ms":  float(np.percentile(lateness, 50)),
+        "p99_ms":  float(np.percentile(lateness, 99)),
+        "max_ms":  float(np.max(lateness)),
+    }
+
+
 class RobotControl:
 
 
@@ -22,18 +224,51 @@ class RobotControl:
 
         # Robot Mathematics
         self.calculate = DH()
+        self.workspace = Workspace(self.calculate)    # Reachable targets
+        self.ik_cache  = IKCache(self.calculate)      # Joystick targets already solved
 
         # Connection with Ev3
         self.ev3 = Ev3Client(host=HOST)
 
         # Robot Trajectory
         self.__trajectory = RobotTrajectory()
+        self.profile      = "cubic"   # Interpolation used between points
+        self.rate         = 10        # Trajectory sampling rate (Hz)
+        self.streaming    = False     # Upload trajectories to be played by the Ev3
 
         # Robot parameters
         self.__all_joints_position  = []      # Current position of all joints
         self.__manipulator_position = []      # Current (x,y,z) position of the manipulator
         self.__joint_angles         = []      # Current joint angles
         self.__is_moving            = False   # If the robot is moving
+        self.last_jitter            = None    # Timing of the last movement
+        self.last_validation        = None    # Report of the last trajectory checked
+
+        # Movements run one after the other, in the order given, by a single
+        # worker. Each abort cancels every movement submitted before it
+        self.__movements  = queue.Queue()
+        self.__aborts     = 0         # Number of aborts so far
+        self.__abort_lock = th.Lock()
+        self.__mover = th.Thread(target=self.__thread_move_robot, daemon=True)
+        self.__mover.start()
+
+        # State updates during movements, only the latest one is kept. Every
+        # change is numbered: updates published before the last direct set
+        # (set_joint_angles, set_manipulator_position) are stale and dropped
+        self.__state_queue = queue.Queue(maxsize=1)
+        self.__state_lock  = th.Lock()
+        self.__state_seq   = 0        # Number of the last state change
+        self.__direct_seq  = 0        # Number of the last direct set
+        self.__state_worker = th.Thread(target=self.__thread_update_state, daemon=True)
+        self.__state_worker.start()
+
+        # State change notifications, coalesced to at most notify_rate per second
+        self.notify_rate            = 60      # Hz, the display rate
+        self.__observers            = []
+        self.__state_changed        = th.Condition()
+        self.__state_dirty          = False
+        self.__notifier = th.Thread(target=self.__thread_notify, daemon=True)
+        self.__notifier.start()
 
         # Set an initial position
         self.set_joint_angles(0, 0, 0, 0)
@@ -44,31 +279,141 @@ class RobotControl:
     def get_joint_angles(self):         return self.__joint_angles
     def get_manipulator_position(self): return self.__manipulator_position
     def get_all_joints_position(self):  return self.__all_joints_position
+    def get_ev3_health(self):           return self.ev3.health()
+    def get_latency(self):              return self.ev3.latency.summary()
+    def get_ik_cache_statistics(self):  return self.ik_cache.statistics()
+
+    def get_measured_joint_angles(self):
+
+        """ Last joint angles measured by the Ev3, None before any telemetry """
+
+        latest = self.ev3.telemetry.latest
+        if latest is None:
+            return None
+        j1, j2, j3, j4 = latest[1].joints
+        return (radians(j1), radians(j2), radians(j3), j4)
+
+    def get_state(self) -> dict:
+        return {
+            "joint_angles":         self.__joint_angles,
+            "manipulator_position": self.__manipulator_position,
+            "all_joints_position":  self.__all_joints_position,
+            "is_moving":            self.__is_moving,
+        }
 
     # Setters
     def set_is_moving(self, value: bool):
         self.__is_moving = value
+        self.__notify()
 
     def set_joint_angles(self, j1: float, j2: float, j3: float, j4: float) -> None:
         x, y, z = self.calculate.fw_kinematics((j1, j2, j3))
-        self.__joint_angles         = (j1, j2, j3, j4)
-        self.__all_joints_position  = (x, y, z)
-        self.__manipulator_position = (x[-1], y[-1], z[-1])
+        with self.__state_lock:
+            self.__state_seq += 1
+            self.__direct_seq = self.__state_seq
+            self.__joint_angles         = (j1, j2, j3, j4)
+            self.__all_joints_position  = (x, y, z)
+            self.__manipulator_position = (x[-1], y[-1], z[-1])
+        self.__notify()
         self.ev3_set_position(*self.__joint_angles)
 
     def set_manipulator_position(self, x: float, y: float, z: float) -> None:
+
+        # Unreachable targets go to the closest reachable point before any solver runs
+        x, y, z = self.workspace.project((x, y, z))
+
         _, _, _, j4 = self.get_joint_angles()
-        j1, j2, j3 = self.calculate.bw_kinematics(
+        j1, j2, j3 = self.ik_cache.solve(
                         target=(x, y, z),
                         last_pos=self.get_joint_angles()[:3])
         if not (isnull(j1) or isnull(j2) or isnull(j3)):
-            self.__joint_angles         = (j1, j2, j3, j4)
-            self.__all_joints_position  = self.calculate.fw_kinematics((j1, j2, j3))
-            self.__manipulator_position = (x, y, z)
+            positions = self.calculate.fw_kinematics((j1, j2, j3))
+            with self.__state_lock:
+                self.__state_seq += 1
+                self.__direct_seq = self.__state_seq
+                self.__joint_angles         = (j1, j2, j3, j4)
+                self.__all_joints_position  = positions
+                self.__manipulator_position = (x, y, z)
+            self.__notify()
             self.ev3_set_position(*self.__joint_angles)
 
 
-    def ev3_set_position(self, j1: float, j2: float, j3: float, j4: float) -> None:
+    def __publish_state(self, joints: tuple, positions: np.ndarray) -> None:
+
+        """ Queue a state update, replacing the pending one if any """
+
+        with self.__state_lock:
+            self.__state_seq += 1
+            seq = self.__state_seq
+        while True:
+            try:
+                self.__state_queue.put_nowait((seq, joints, positions))
+                return
+            except queue.Full:
+                try:
+                    self.__state_queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+
+    def __thread_update_state(self) -> None:
+
+        """
+            Apply the published states (joints and the (4, 3) frame
+            positions), unless a direct set came after them
+        """
+
+        while True:
+            seq, joints, positions = self.__state_queue.get()
+            x, y, z = positions.T
+            with self.__state_lock:
+                if seq < self.__direct_seq:
+                    continue
+                self.__joint_angles         = joints
+                self.__all_joints_position  = (x, y, z)
+                self.__manipulator_position = (x[-1], y[-1], z[-1])
+            self.__notify()
+
+
+    def subscribe(self, callback) -> None:
+
+        """
+            Call callback(state) (see get_state) when the state changes, from
+            the notifier thread. Changes closer than 1/notify_rate are
+            coalesced into one call with the latest state
+        """
+
+        self.__observers.append(callback)
+
+    def unsubscribe(self, callback) -> None:
+        self.__observers.remove(callback)
+
+
+    def __notify(self) -> None:
+        with self.__state_changed:
+            self.__state_dirty = True
+            self.__state_changed.notify()
+
+
+    def __thread_notify(self) -> None:
+
+        """ Deliver the state changes, sleeping while nothing changes """
+
+        while True:
+            with self.__state_changed:
+                self.__state_changed.wait_for(lambda: self.__state_dirty)
+                self.__state_dirty = False
+
+            state = self.get_state()
+            for callback in list(self.__observers):
+                callback(state)
+
+            # Changes until then are delivered together
+            sleep(1/self.notify_rate)
+
+
+    def ev3_set_position(self, j1: float, j2: float, j3: float, j4: float,
+                         must_execute: bool = False, generated: float = None) -> None:
 
         """ Set a value in degrees to Ev3 motors """
 
@@ -76,92 +421,190 @@ class RobotControl:
         joints_in_degrees = [degrees(j1), degrees(j2), degrees(j3), j4]
 
         # Set position to Ev3 motors
-        self.ev3.set_position(*joints_in_degrees)
+        self.ev3.set_position(*joints_in_degrees, must_execute=must_execute, generated=generated)
 
 
-    def __thread_move_robot(self, j1: tuple, j2: tuple, j3: tuple, j4: tuple, time: tuple) -> None:
+    def __thread_move_robot(self) -> None:
 
-        """ Send commands to Ev3 to execute an trajectory """
+        """ Execute the submitted movements, in order, skipping the aborted ones """
+
+        while True:
+            aborts, movements = self.__movements.get()
+            for movement in movements:
+                if aborts != self.__aborts:
+                    break
+                self.__execute(aborts, *movement)
+            if self.__movements.empty():
+                self.set_is_moving(False)
 
-        # Keep waiting while the robot is executing another movement
-        while self.get_is_moving():
-            pass
 
-        # It's available execute the movement
+    def __execute(self, aborts: int, j1: tuple, j2: tuple, j3: tuple, j4: tuple, time: tuple) -> None:
+
+        """ Send commands to Ev3 to execute an trajectory """
+
         self.set_is_moving(True)
 
-        # Get initial datetime
-        ini = now = datetime.now()
+        # Upload the whole trajectory, then only follow it locally
+        streaming = self.streaming and self.ev3.binary
+        if streaming:
+            trajectory_id = self.ev3.upload_trajectory(
+                time, np.degrees(j1), np.degrees(j2), np.degrees(j3), j4)
+            self.ev3.start_trajectory(trajectory_id)
+
+        # How late each point was sent
+        lateness = np.empty(len(j1))
+
+        # Position of all joints along the whole movement
+        positions = self.calculate.fw_kinematics_batch(np.column_stack([j1, j2, j3]))
+
+        # Get initial time
+        ini = perf_counter()
 
         # Iterates over all points, set and update
         for i in range(len(j1)):
 
+            if aborts != self.__aborts:
+                lateness = lateness[:i]
+                break
+
             # Wait for the correct time to send the point
-            while (now-ini).total_seconds() < time[i]:
-                now = datetime.now()
+            now = sleep_until(ini + time[i])
+            lateness[i] = now - (ini + time[i])
+            self.ev3.latency.record("schedule", lateness[i])
 
+            # The Ev3 may skip points when late, but never the last one
             joints = (j1[i], j2[i], j3[i], j4[i])
-            self.ev3_set_position(*joints)
-            updater = th.Thread(target=lambda: self.set_joint_angles(*joints))
-            updater.start()
+            if not streaming:
+                self.ev3_set_position(*joints, must_execute=(i == len(j1) - 1), generated=now)
+            self.__publish_state(joints, positions[i])
 
         # Movement finished
-        self.set_is_moving(False)
+        self.last_jitter = jitter_statistics(lateness)
         print("Movement finished.")
+        if len(lateness):
+            print("Jitter: %(p50_ms).3f ms (p50), %(p99_ms).3f ms (p99), %(max_ms).3f ms (max)"
+                  % self.last_jitter)
 
     
-    def move_robot(self, j1: tuple, j2: tuple, j3: tuple, j4: tuple, time: tuple) -> None:
+    def abort_movement(self) -> None:
 
-        """ Create a thread that send commands to execute the trajectory """
+        """ Stop the running movement and the ones waiting for it, on the Ev3 too when streaming """
 
-        sender = th.Thread(target=lambda: self.__thread_move_robot(j1, j2, j3, j4, time))
-        sender.start()
+        with self.__abort_lock:
+            self.__aborts += 1
+        if self.streaming and self.ev3.binary:
+            self.ev3.abort_trajectory()
 
+    
+    def validate_trajectory(self, j1: tuple, j2: tuple, j3: tuple, j4: tuple, time: tuple) -> dict:
+        self.last_validation = validate_trajectory(self.calculate, time, j1, j2, j3, j4,
+                                                   self.__trajectory.max_speed,
+                                                   self.__trajectory.max_acceleration)
+        return self.last_validation
 
-    def go_to(self, target_j1: float, target_j2: float, target_j3: float, target_j4: float, time: float):
+    def __is_valid(self, j1: tuple, j2: tuple, j3: tuple, j4: tuple, time: tuple) -> bool:
+        report = self.validate_trajectory(j1, j2, j3, j4, time)
+        if not report["valid"]:
+            print("Trajectory rejected: %s at sample %d (%.2f s)"
+                  % (", ".join(report["reason"]), report["index"], report["time"]))
+        return report["valid"]
+
+    def __submit(self, *movements: tuple) -> None:
+
+        """ Queue (j1, j2, j3, j4, time) movements to be executed one after the other """
+
+        with self.__abort_lock:
+            self.__movements.put((self.__aborts, movements))
+
+    def move_robot(self, j1: tuple, j2: tuple, j3: tuple, j4: tuple, time: tuple) -> bool:
+
+        """ Execute the trajectory after the movements already submitted, if valid """
+
+        if not self.__is_valid(j1, j2, j3, j4, time):
+            return False
+        self.__submit((j1, j2, j3, j4, time))
+        return True
+
+
+    def __approach(self, target_j1: float, target_j2: float, target_j3: float, target_j4: float,
+                 time: float) -> tuple:
+
+        """ Sampled (j1, j2, j3, j4, time) movement from the current joint angles to the target """
 
-        """
-            Calculate the trajectory from the current point to another
-            knowing the joints positions
-        """
-        
         # Get current joint angles
         j1, j2, j3, j4 = self.get_joint_angles()
 
         # Get the trajectory
         time, j1, j2, j3, j4 = self.__trajectory.go_to((j1, target_j1), (j2, target_j2),
-                                                    (j3, target_j3), (j4, target_j4), time)
+                                                    (j3, target_j3), (j4, target_j4), time,
+                                                    self.profile, self.rate)
+        return j1, j2, j3, j4, time
+
+    def go_to(self, target_j1: float, target_j2: float, target_j3: float, target_j4: float,
+              time: float) -> bool:
+
+        """
+            Calculate the trajectory from the current point to another
+            knowing the joints positions. False if it was rejected
+        """
 
-        self.move_robot(j1, j2, j3, j4, time)
+        return self.move_robot(*self.__approach(target_j1, target_j2, target_j3, target_j4, time))
 
     
     # Trajectory function
+    def set_joint_limits(self, max_speed = None, max_acceleration = None):
+        self.__trajectory.max_speed        = max_speed
+        self.__trajectory.max_acceleration = max_acceleration
+
+    def retime_trajectory(self, ramp_time: float = 0.5) -> tuple:
+
+        """ Replace the trajectory times by the fastest the Ev3 allows """
+
+        max_speed, max_acceleration = ev3_joint_limits(ramp_time)
+        trajectory, before, after = self.__trajectory.retime(self.profile, max_speed, max_acceleration)
+        self.__trajectory.trajectory = trajectory
+        self.__trajectory.presampled = None
+        print("Cycle time: %.2f s -> %.2f s" % (before, after))
+        return before, after
+
     def remove_trajectory(self): self.__trajectory.remove_all()
     def add_to_trajectory(self, si: float, sf: float, time: float):
         joints = self.get_joint_angles()
         self.__trajectory.add_point(joints, si, sf, time)
 
 
-    def run_trajectory(self):
+    def run_trajectory(self) -> bool:
 
-        """ Execute the created trajectory """
+        """ Execute the created trajectory, False if it was rejected """
 
+        self.last_validation = None
         if not self.__trajectory.is_empty():
 
-            # Get the initial angles of trajectory
-            j1, j2, j3, j4 = self.__trajectory.initial_point()
-
-            # Move the robot to the initial point of trajectory
-            self.go_to(j1, j2, j3, j4, 2)
-
-            # Execute the trajectory (5 points per second)
-            time, j1, j2, j3, j4 = self.__trajectory.cubic(10)
-            self.move_robot(j1, j2, j3, j4, time)
+            # Check the whole trajectory before moving at all
+            time, j1, j2, j3, j4 = self.__trajectory.sample(self.profile, self.rate)
+            report = self.validate_trajectory(j1, j2, j3, j4, time)
+            if not report["valid"]:
+                print("Trajectory rejected: %s at sample %d (%.2f s)"
+                      % (", ".join(report["reason"]), report["index"], report["time"]))
+                return False
+
+            # Move the robot to the initial point of trajectory, the
+            # trajectory is only played from there
+            approach = self.__approach(*self.__trajectory.initial_point(), 2)
+            if not self.__is_valid(*approach):
+                print("Trajectory not run, the move to its initial point was rejected")
+                return False
+
+            # Both as one submission, an abort stops the approach and the trajectory
+            self.__submit(approach, (j1, j2, j3, j4, time))
+            self.last_validation = report
+            return True
         else:
             print("None trajectory created!")
+            return False
 
     def save_trajectory(self, file_name: str):
-        return self.__trajectory.save_trajectory(file_name=file_name)
+        return self.__trajectory.save_trajectory(file_name=file_name, profile=self.profile, rate=self.rate)
 
     def load_trajectory(self, filename: str):
         return self.__trajectory.load_trajectory(filename=filename)
@@ -171,19 +614,44 @@ class RobotTrajectory:
 
     def __init__(self)  -> None:
 
+        # Joint limits, per joint (rad/s and rad/s², deg/s and deg/s² for the claw),
+        # None disables the limit
+        self.max_speed        = EV3_MAX_SPEED
+        self.max_acceleration = EV3_MAX_ACCELERATION
+
         # Store a trajectory
         self.trajectory = {
             "j1": [], "j2": [], "j3": [], "j4": [], 
             "si": [], "sf": [], "time": []
         }
 
-    def save_trajectory(self, file_name: str):
+        # Trajectory sampled ahead, loaded from a binary file:
+        # (profile, rate, limits_key, samples)
+        self.presampled = None
+
+    def save_trajectory(self, file_name: str, profile: str = "cubic", rate: float = 10):
+
+        """ Save as CSV, or as binary (.rtj) with the trajectory sampled at rate """
+
+        if Path(file_name).suffix == trajectory_file.SUFFIX:
+            samples = self.sample(profile, rate) if rate and not self.is_empty() else None
+            trajectory_file.save(file_name, self.trajectory, samples, rate, profile,
+                                 (self.max_speed, self.max_acceleration))
+            return True
         pd.DataFrame(self.trajectory).to_csv(file_name, index=False)
         return True
 
     def load_trajectory(self, filename: str):
         new_trajectory = {}
+        self.presampled = None
         try:
+            if Path(filename).suffix == trajectory_file.SUFFIX:
+                new_trajectory, samples, header = trajectory_file.load(filename)
+                if samples is not None:
+                    self.presampled = (header["profile"], header["rate"],
+                                       limits_key(*header["limits"]), samples)
+                self.trajectory = new_trajectory
+                return True
             df = pd.read_csv(filename)
 
         except FileNotFoundError:
@@ -198,13 +666,15 @@ class RobotTrajectory:
 
         """ Check if a trajectory is empty """
 
-        return self.trajectory["j1"] == []
+        return len(self.trajectory["j1"]) == 0
 
 
     def add_point(self, joints: tuple, si: float, sf: float, time: float) -> None:
 
         """ Add a point to the trajectory """
 
+        self.presampled = None
+
         self.trajectory["j1"].append(joints[0])
         self.trajectory["j2"].append(joints[1])
         self.trajectory["j3"].append(joints[2])
@@ -218,6 +688,8 @@ class RobotTrajectory:
 
         """ Reset the trajectory """
 
+        self.presampled = None
+
         self.trajectory = {
             "j1": [], "j2": [], "j3": [], "j4": [], 
             "si": [], "sf": [], "time": []
@@ -236,59 +708,182 @@ class RobotTrajectory:
         return (j1, j2, j3, j4)
 
 
-    def cubic(self, rate: float, trajectory = None) -> tuple:
-        
-        """ Computes a cubic trajectory of all points """
+    def polynomial(self, profile: str, trajectory = None) -> PPoly:
+
+        """
+            Piecewise polynomial of all points for a profile:
+
+            cubic         cubic per segment, speeds si/sf at the points
+            quintic       quintic per segment, speeds si/sf and zero
+                          acceleration at the points
+            minimum_jerk  quintic per segment starting and stopping at rest
+            cubic_spline  single spline through all points, continuous
+                          acceleration (C2), speeds si/sf at the ends
+        """
 
-        if trajectory == None:
+        if trajectory is None:
             trajectory = self.trajectory
 
-        time = []
-        j1, j2, j3, j4 = [], [], [], []
+        times = np.asarray(trajectory["time"], dtype=float)
+        si = np.asarray(trajectory["si"], dtype=float)[1:, None]
+        sf = np.asarray(trajectory["sf"], dtype=float)[1:, None]
+        q = np.column_stack([np.asarray(trajectory[key], dtype=float)
+                             for key in ["j1", "j2", "j3", "j4"]])
+
+        if profile == "cubic_spline":
+            bc_type = ((1, np.full(4, si[0, 0])), (1, np.full(4, sf[-1, 0])))
+            return CubicSpline(times, q, axis=0, bc_type=bc_type)
+
+        # Segment duration, displacement and boundary speeds (segments, joints)
+        T = np.diff(times)[:, None]
+        h = np.diff(q, axis=0)
+        v0 = np.broadcast_to(si, h.shape)
+        v1 = np.broadcast_to(sf, h.shape)
+        zero = np.zeros_like(h)
+
+        # Coefficients in local time, lowest degree first
+        if profile == "cubic":
+            coefficients = [q[:-1], v0,
+                            (3*h - (2*v0 + v1)*T)/T**2,
+                            (-2*h + (v0 + v1)*T)/T**3]
+        elif profile in ("quintic", "minimum_jerk"):
+            if profile == "minimum_jerk":
+                v0 = v1 = zero
+            coefficients = [q[:-1], v0, zero,
+                            (20*h - (8*v1 + 12*v0)*T)/(2*T**3),
+                            (-30*h + (14*v1 + 16*v0)*T)/(2*T**4),
+                            (12*h - 6*(v1 + v0)*T)/(2*T**5)]
+        else:
+            raise ValueError("Unknown trajectory profile %s" % profile)
+
+        return PPoly(np.stack(coefficients[::-1]), times)
+
 
-        # Iterates over all points
-        for i in range(1, len(trajectory["j1"])):
+    def time_scale(self, polynomial: PPoly, max_speed = None, max_acceleration = None) -> float:
 
-            # Time to execute the trajectory
-            ti, tf = trajectory["time"][i-1], trajectory["time"][i]
+        """
+            Factor (>= 1) by which the duration of the trajectory must be
+            stretched to respect the joint speed and acceleration limits
+        """
 
-            # Speed in target points
-            si, sf =  trajectory["si"][i], trajectory["sf"][i]
+        scale = 1.0
+        if max_speed is not None:
+            speed = self.peak(polynomial, 1)
+            scale = max(scale, np.max(speed/np.asarray(max_speed, dtype=float)))
+        if max_acceleration is not None:
+            acceleration = self.peak(polynomial, 2)
+            scale = max(scale, np.sqrt(np.max(acceleration/np.asarray(max_acceleration, dtype=float))))
+        return scale
 
-            # Compute the time list
-            t = np.linspace(ti, tf, int((tf - ti)*rate))
-            time += list(t)
+    @staticmethod
+    def peak(polynomial: PPoly, order: int) -> np.ndarray:
 
-            # Compute the inverse of time matrix
-            timeMatrix = np.array([[1, ti, ti**2,     ti**3],
-                                   [0,  1,  2*ti, 3*(ti**2)],
-                                   [1, tf, tf**2,     tf**3],
-                                   [0,  1,  2*tf, 3*(tf**2)]])
-            timeMatrix = np.linalg.inv(timeMatrix)
-            
-            for key in ["j1", "j2", "j3", "j4"]:
+        """
+            Exact maximum of the absolute derivative of each joint: at the
+            ends of the segments (from both sides, the derivative may jump
+            at the points) or where the next derivative is zero
+        """
 
-                # Move points
-                qi = trajectory[key][i-1]
-                qf = trajectory[key][i]
+        derivative = polynomial.derivative(order)
+        breaks = polynomial.x
+        ends = np.concatenate([breaks, np.nextafter(breaks[1:], -np.inf)])
+        peaks = np.abs(derivative(ends)).max(axis=0)
 
-                # Create the cubic self.trajectory
-                trajectory_matrix = np.array([qi, si, qf, sf])
-                a0, a1, a2, a3 = list(timeMatrix @ trajectory_matrix)
+        # One joint at a time, roots() of several columns misses some
+        # (SciPy 1.17)
+        next_derivative = derivative.derivative()
+        for joint in range(len(peaks)):
+            t = PPoly(next_derivative.c[:, :, joint], breaks).roots(discontinuity=False,
+                                                                    extrapolate=False)
+            t = t[np.isfinite(t)]
+            if len(t):
+                peaks[joint] = max(peaks[joint], np.abs(derivative(t)[:, joint]).max())
+        return peaks
+
+    def sample(self, profile: str, rate: float, trajectory = None) -> tuple:
+
+        """
+            Samples a trajectory profile at rate (Hz), slowing it down
+            uniformly when the joint limits would be exceeded. A single
+            point is held (one sample), no points give empty arrays
+        """
 
-                if key == "j1":
-                    j1 += list(a0 + a1*t + a2*(t**2) + a3*(t**3))
-                elif key == "j2":
-                    j2 += list(a0 + a1*t + a2*(t**2) + a3*(t**3))
-                elif key == "j3":
-                    j3 += list(a0 + a1*t + a2*(t**2) + a3*(t**3))
-                elif key == "j4":
-                    j4 += list(a0 + a1*t + a2*(t**2) + a3*(t**3))
+        if trajectory is None:
+            trajectory = self.trajectory
 
+            # Sampled when saved, valid with the same limits
+            if (self.presampled is not None and self.presampled[:3]
+                    == (profile, rate, limits_key(self.max_speed, self.max_acceleration))):
+                return self.presampled[3]
+
+        # A single point has no segment to interpolate, hold it
+        if len(trajectory["time"]) < 2:
+            time, j1, j2, j3, j4 = (np.asarray(trajectory[key], dtype=float)
+                                    for key in ["time", "j1", "j2", "j3", "j4"])
+            return time, j1, j2, j3, j4
+
+        polynomial = self.polynomial(profile, trajectory)
+        scale = self.time_scale(polynomial, self.max_speed, self.max_acceleration)
+
+        # Stretch time: speeds are divided by scale, accelerations by scale²
+        if scale > 1:
+            t0 = trajectory["time"][0]
+            trajectory = dict(trajectory)
+            trajectory["time"] = t0 + (np.asarray(trajectory["time"], dtype=float) - t0)*scale
+            trajectory["si"] = np.asarray(trajectory["si"], dtype=float)/scale
+            trajectory["sf"] = np.asarray(trajectory["sf"], dtype=float)/scale
+            polynomial = self.polynomial(profile, trajectory)
+
+        t0, tf = polynomial.x[0], polynomial.x[-1]
+        samples = np.empty((int((tf - t0)*rate) + 1, 5))
+        samples[:, 0] = np.linspace(t0, tf, len(samples))
+        samples[:, 1:] = polynomial(samples[:, 0])
+
+        time, j1, j2, j3, j4 = samples.T
         return time, j1, j2, j3, j4
 
 
-    def go_to(self, j1: tuple, j2: tuple, j3: tuple, j4: tuple, time: float):
+    def retime(self, profile: str, max_speed, max_acceleration, trajectory = None,
+               min_duration: float = 0.1) -> tuple:
+
+        """
+            Minimum time schedule of the points for a profile and joint
+            limits. Each segment gets the shortest duration in which its
+            slowest joint respects the limits, segments without any motion
+            keep their duration (they are pauses). Returns the new trajectory
+            and the cycle time before and after
+        """
+
+        if trajectory is None:
+            trajectory = self.trajectory
+
+        times = np.asarray(trajectory["time"], dtype=float)
+        h = np.abs(np.diff(np.column_stack([np.asarray(trajectory[key], dtype=float)
+                                            for key in ["j1", "j2", "j3", "j4"]]), axis=0))
+        peak_speed, peak_acceleration = PROFILE_PEAKS[profile]
+
+        # Shortest duration of each segment, limited by its slowest joint
+        durations = np.maximum(peak_speed*h/max_speed,
+                               np.sqrt(peak_acceleration*h/max_acceleration)).max(axis=1)
+        durations = np.where(h.max(axis=1) > 0,
+                             np.maximum(durations, min_duration), np.diff(times))
+
+        retimed = {key: np.asarray(value) for key, value in trajectory.items()}
+        retimed["time"] = times[0] + np.concatenate([[0], np.cumsum(durations)])
+
+        # Speeds at the points and the spline coupling may still exceed the limits
+        polynomial = self.polynomial(profile, retimed)
+        scale = self.time_scale(polynomial, max_speed, max_acceleration)
+        if scale > 1:
+            retimed["time"] = times[0] + (retimed["time"] - times[0])*scale
+            retimed["si"] = retimed["si"]/scale
+            retimed["sf"] = retimed["sf"]/scale
+
+        return retimed, times[-1] - times[0], retimed["time"][-1] - times[0]
+
+
+    def go_to(self, j1: tuple, j2: tuple, j3: tuple, j4: tuple, time: float,
+              profile: str = "cubic", rate: float = 10):
 
         """
             Calculate the trajectory from a point to another (just 2 points)
@@ -299,5 +894,5 @@ class RobotTrajectory:
             "si": [0, 0], "sf": [0, 0], "time": [0, time]
         }
 
-        return self.cubic(10, trajectory)
+        return self.sample(profile, rate, trajectory)
     
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""
+Tests of the trajectory generation and validation.
+
+Runs on the PC:
+
+    python -m pytest robot_control/test_control.py    (from the interface folder)
+"""
+
+import sys
+from pathlib import Path
+from time import monotonic, sleep
+
+import numpy as np
+import pytest
+
+INTERFACE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(INTERFACE))
+
+from robot_control import control
+from robot_control.control import PROFILE_PEAKS, RobotTrajectory, validate_trajectory
+from robot_math.DH import DH
+
+TRAJECTORIES = sorted(INTERFACE.glob("*.csv"))
+
+
+@pytest.fixture(scope="module")
+def dh():
+    return DH()
+
+
+@pytest.mark.parametrize("profile", sorted(PROFILE_PEAKS))
+@pytest.mark.parametrize("path", TRAJECTORIES, ids=lambda path: path.name)
+def test_sampled_trajectory_is_valid(dh, path, profile):
+    trajectory = RobotTrajectory()
+    trajectory.load_trajectory(str(path))
+    result = validate_trajectory(dh, *trajectory.sample(profile, 10))
+    assert result["valid"], result
+
+
+def waypoints(*points, duration=5.0):
+    """Rest to rest segments through (j1, j2, j3, j4) points, duration apart"""
+    q = np.array(points, dtype=float)
+    return {"j1": q[:, 0], "j2": q[:, 1], "j3": q[:, 2], "j4": q[:, 3],
+            "si": np.zeros(len(q)), "sf": np.zeros(len(q)),
+            "time": np.arange(len(q))*duration}
+
+
+def move(start, end, duration=5.0, limited=True):
+    trajectory = RobotTrajectory()
+    if not limited:
+        trajectory.max_speed = trajectory.max_acceleration = None
+    return trajectory.sample("quintic", 50, waypoints(start, end, duration=duration))
+
+
+@pytest.mark.parametrize("profile", sorted(PROFILE_PEAKS))
+def test_profiles_pass_through_the_waypoints(profile):
+    trajectory = RobotTrajectory()
+    trajectory.load_trajectory(str(INTERFACE / "final.csv"))
+    polynomial = trajectory.polynomial(profile)
+    expected = np.column_stack([trajectory.trajectory[key] for key in ["j1", "j2", "j3", "j4"]])
+    np.testing.assert_allclose(polynomial(trajectory.trajectory["time"]), expected, atol=1e-9)
+
+
+@pytest.mark.parametrize("profile", sorted(PROFILE_PEAKS))
+def test_rest_to_rest_peaks(profile):
+    polynomial = RobotTrajectory().polynomial(profile, waypoints((0, 0, 0, 0), (1, 2, 3, 4), duration=2))
+    speed, acceleration = PROFILE_PEAKS[profile]
+    np.testing.assert_allclose(RobotTrajectory.peak(polynomial, 1), np.array([1, 2, 3, 4])*speed/2)
+    np.testing.assert_allclose(RobotTrajectory.peak(polynomial, 2), np.array([1, 2, 3, 4])*acceleration/4)
+
+
+def test_sample_is_only_slowed_down_to_the_limits():
+    slow = move((0, 0, 0, 0), (0.1, 0, 0, 0), duration=5)
+    assert slow[0][-1] == pytest.approx(5)
+    fast = move((0, 0, 0, 0), (1, 0, 0, 0), duration=0.1)
+    assert fast[0][-1] > 0.1
+    assert fast[1][-1] == pytest.approx(1)
+
+
+@pytest.mark.parametrize("end, reason", [
+    ((0, 2.0, 0, 0), "joint_range"),
+    ((0, -1.5, 0, 0), "ground"),
+    ((0, -1.5, -1.53, 0), "self_collision"),
+])
+def test_validation_reports_the_violation(dh, end, reason):
+    result = validate_trajectory(dh, *move((0, 0, 0, 0), end))
+    assert not result["valid"]
+    assert reason in result["reason"]
+    assert result["index"] == result["checks"][reason] > 0
+
+
+def test_validation_checks_speed_and_acceleration(dh):
+    samples = move((0, 0, 0, 0), (1, 0, 0, 0), duration=0.5, limited=False)
+    result = validate_trajectory(dh, *samples)
+    assert not result["valid"]
+    assert result["checks"]["speed"] is not None
+    assert result["checks"]["acceleration"] is not None
+    assert validate_trajectory(dh, *samples, max_speed=None, max_acceleration=None)["valid"]
+
+
+def test_validation_allows_moving_back_into_range(dh):
+    assert validate_trajectory(dh, *move((0, 1.8, 0, 0), (0, 1.0, 0, 0)))["valid"]
+    assert not validate_trajectory(dh, *move((0, 1.8, 0, 0), (0, 1.9, 0, 0)))["valid"]
+
+
+def test_validation_flags_jumps_at_repeated_times(dh):
+    time = [0.0, 1.0, 1.0, 2.0]
+    still = [0.0, 0.0, 0.0, 0.0]
+    assert validate_trajectory(dh, time, still, still, still, still)["valid"]
+    result = validate_trajectory(dh, time, [0.0, 0.0, 0.1, 0.1], still, still, still)
+    assert result["reason"] == ["speed"]
+    assert result["index"] == 2
+
+
+@pytest.fixture
+def robot(monkeypatch):
+    # Nothing listens there, the commands are dropped
+    monkeypatch.setattr(control, "HOST", "localhost")
+    robot = control.RobotControl()
+    robot.rate = 50
+    try:
+        yield robot
+    finally:
+        robot.ev3.close()
+
+
+def wait_stopped(robot, timeout=10.0):
+    deadline = monotonic() + timeout
+    while robot.get_is_moving() and monotonic() < deadline:
+        sleep(0.05)
+    return not robot.get_is_moving()
+
+
+def test_abort_stops_the_approach_and_the_trajectory(robot):
+    robot.set_joint_angles(0.2, 0, 0, 0)
+    robot.add_to_trajectory(0, 0, 0)
+    robot.set_joint_angles(0.4, 0, 0, 0)
+    robot.add_to_trajectory(0, 0, 1)
+    robot.set_joint_angles(0, 0, 0, 0)
+
+    assert robot.run_trajectory()
+    robot.abort_movement()
+    sleep(0.5)
+    assert wait_stopped(robot)
+    assert robot.get_joint_angles() == (0, 0, 0, 0)
+
+
+def test_movements_run_in_order(robot):
+    assert robot.go_to(0.1, 0, 0, 0, 0.5)
+    assert robot.go_to(0.1, 0, 0.1, 0, 0.5)
+    sleep(0.1)
+    assert wait_stopped(robot)
+    assert robot.get_joint_angles() == pytest.approx((0.1, 0, 0.1, 0))
@@ -0,0 +1,91 @@
+"""
+Tests of the binary trajectory files (.rtj).
+
+    python -m pytest robot_control/test_trajectory_file.py    (from the interface folder)
+"""
+
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+INTERFACE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(INTERFACE))
+
+from robot_control import trajectory_file
+from robot_control.control import EV3_MAX_ACCELERATION, EV3_MAX_SPEED, RobotTrajectory
+from robot_control.trajectory_file import TrajectoryFileError
+
+
+@pytest.fixture
+def trajectory():
+    trajectory = RobotTrajectory()
+    trajectory.load_trajectory(str(INTERFACE / "final.csv"))
+    return trajectory
+
+
+def test_round_trip(tmp_path, trajectory):
+    path = tmp_path / "final.rtj"
+    samples = trajectory.sample("quintic", 20)
+    trajectory_file.save(path, trajectory.trajectory, samples, 20, "quintic",
+                         (EV3_MAX_SPEED, None))
+
+    waypoints, loaded, header = trajectory_file.load(path)
+    for column in trajectory_file.WAYPOINTS:
+        np.testing.assert_array_equal(waypoints[column], trajectory.trajectory[column])
+    for expected, column in zip(samples, loaded):
+        np.testing.assert_array_equal(column, expected)
+    assert header == {"rate": 20, "profile": "quintic", "units": trajectory_file.UNITS,
+                      "limits": [EV3_MAX_SPEED.tolist(), None]}
+
+
+def test_waypoints_only(tmp_path, trajectory):
+    path = tmp_path / "final.rtj"
+    trajectory_file.save(path, trajectory.trajectory)
+    waypoints, samples, header = trajectory_file.load(path)
+    assert samples is None
+    assert header["rate"] == 0
+    np.testing.assert_array_equal(waypoints["time"], trajectory.trajectory["time"])
+
+
+def test_presampled_trajectory_is_played_as_saved(tmp_path, trajectory):
+    path = tmp_path / "final.rtj"
+    trajectory.save_trajectory(str(path), "cubic_spline", 10)
+    samples = trajectory_file.load(path)[1]
+
+    loaded = RobotTrajectory()
+    loaded.load_trajectory(str(path))
+    presampled = loaded.sample("cubic_spline", 10)
+    assert presampled is loaded.presampled[3]
+    np.testing.assert_array_equal(presampled, samples)
+
+    # Other rates, profiles or limits are sampled again
+    assert len(loaded.sample("cubic_spline", 20)[0]) > len(samples[0])
+    assert loaded.sample("quintic", 10) is not presampled
+    loaded.max_acceleration = EV3_MAX_ACCELERATION/2
+    assert loaded.sample("cubic_spline", 10) is not presampled
+
+
+def test_convert(tmp_path):
+    csv = shutil.copy(INTERFACE / "teste.csv", tmp_path)
+    path = trajectory_file.convert(csv, "quintic", 10)
+    assert path == tmp_path / "teste.rtj"
+    waypoints, samples, header = trajectory_file.load(path)
+    assert header["profile"] == "quintic"
+    assert len(samples) == len(trajectory_file.SAMPLES)
+
+
+@pytest.mark.parametrize("corrupt, message", [
+    (lambda data: data[:10], "too short"),
+    (lambda data: b"XXXX" + data[4:], "not a trajectory file"),
+    (lambda data: data[:4] + b"\x09\x00" + data[6:], "unsupported version"),
+    (lambda data: data[:-8], "truncated"),
+])
+def test_corrupted_files(tmp_path, trajectory, corrupt, message):
+    path = tmp_path / "final.rtj"
+    trajectory.save_trajectory(str(path), "cubic", 10)
+    path.write_bytes(corrupt(path.read_bytes()))
+    with pytest.raises(TrajectoryFileError, match=message):
+        trajectory_file.load(path)
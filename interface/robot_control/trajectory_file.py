@@ -0,0 +1,155 @@
+"""
+    Binary trajectory files (.rtj), loaded by memory mapping them.
+
+    Layout, little-endian:
+
+        header      magic b"RRTJ", version, JSON length, sample rate (Hz,
+                    0 without samples), number of waypoints and of samples
+        JSON        columns, units, sampling profile and joint limits
+        waypoints   float64, one contiguous block per column (WAYPOINTS)
+        samples     float64, one contiguous block per column (SAMPLES)
+
+    Blocks start at multiples of 8 bytes, so every column is a zero-copy
+    view of the file. Existing CSV trajectories are converted by main()
+"""
+
+import json
+import mmap
+import struct
+import sys
+from glob import glob
+from pathlib import Path
+
+import numpy as np
+
+MAGIC   = b"RRTJ"
+VERSION = 1
+HEADER  = struct.Struct("<4sHHIdQQ")    # magic, version, reserved, JSON length, rate, waypoints, samples
+
+WAYPOINTS = ["j1", "j2", "j3", "j4", "si", "sf", "time"]
+SAMPLES   = ["time", "j1", "j2", "j3", "j4"]
+
+# The claw (j4) is commanded in degrees, the other joints in radians
+UNITS = {
+    "j1": "rad", "j2": "rad", "j3": "rad", "j4": "deg",
+    "si": "joint unit/s", "sf": "joint unit/s", "time": "s",
+}
+
+SUFFIX = ".rtj"
+
+
+class TrajectoryFileError(ValueError):
+    pass
+
+
+def aligned(offset: int) -> int:
+    return (offset + 7)//8*8
+
+
+def save(path, trajectory: dict, samples: tuple = None, rate: float = 0,
+         profile: str = None, limits: tuple = (None, None)) -> None:
+
+    """
+        Write the waypoints (dict of WAYPOINTS columns) and optionally the
+        trajectory sampled at rate with profile, (time, j1, j2, j3, j4),
+        under limits (max speed, max acceleration, None when disabled)
+    """
+
+    waypoints = np.array([np.asarray(trajectory[c], dtype="<f8") for c in WAYPOINTS])
+    if samples is None:
+        samples, rate = np.empty((len(SAMPLES), 0), dtype="<f8"), 0
+    samples = np.array([np.asarray(c, dtype="<f8") for c in samples])
+
+    limits = [None if limit is None else np.asarray(limit, dtype=float).tolist()
+              for limit in limits]
+    meta = json.dumps({"waypoints": WAYPOINTS, "samples": SAMPLES, "units": UNITS,
+                       "profile": profile, "limits": limits}).encode()
+    header = HEADER.pack(MAGIC, VERSION, 0, len(meta), rate,
+                         waypoints.shape[1], samples.shape[1])
+    start = aligned(len(header) + len(meta))
+
+    with open(path, "wb") as f:
+        f.write(header + meta + bytes(start - len(header) - len(meta)))
+        f.write(waypoints.tobytes())
+        f.write(samples.tobytes())
+
+
+def load(path) -> tuple:
+
+    """
+        Map a trajectory file. Returns the waypoints as a dict of columns,
+        the samples as (time, j1, j2, j3, j4) or None, and the header
+        (rate, profile, units, limits). The arrays are read-only views of
+        the file. Files without limits were sampled without them
+    """
+
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(buffer) < HEADER.size:
+        raise TrajectoryFileError(f"{path}: too short for a trajectory file")
+    magic, version, _, meta_length, rate, n_waypoints, n_samples = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise TrajectoryFileError(f"{path}: not a trajectory file")
+    if version != VERSION:
+        raise TrajectoryFileError(f"{path}: unsupported version {version}")
+    meta = json.loads(bytes(buffer[HEADER.size:HEADER.size + meta_length]))
+
+    start = aligned(HEADER.size + meta_length)
+    end = start + 8*(len(meta["waypoints"])*n_waypoints + len(meta["samples"])*n_samples)
+    if len(buffer) < end:
+        raise TrajectoryFileError(f"{path}: truncated")
+
+    waypoints = np.frombuffer(buffer, "<f8", len(meta["waypoints"])*n_waypoints, start)
+    waypoints = waypoints.reshape(len(meta["waypoints"]), n_waypoints)
+    trajectory = dict(zip(meta["waypoints"], waypoints))
+
+    samples = None
+    if n_samples:
+        offset = start + waypoints.nbytes
+        samples = np.frombuffer(buffer, "<f8", len(meta["samples"])*n_samples, offset)
+        samples = tuple(samples.reshape(len(meta["samples"]), n_samples))
+
+    header = {"rate": rate, "profile": meta["profile"], "units": meta["units"],
+              "limits": meta.get("limits", [None, None])}
+    return trajectory, samples, header
+
+
+def convert(csv_path, profile: str = "cubic", rate: float = 10) -> Path:
+
+    """ Convert a CSV trajectory, sampled with profile at rate (Hz) if rate """
+
+    import pandas as pd
+
+    from robot_control.control import RobotTrajectory
+
+    df = pd.read_csv(csv_path)
+    trajectory = {c: df[c].to_numpy(dtype=float) for c in WAYPOINTS}
+    sampler = RobotTrajectory()
+    samples = sampler.sample(profile, rate, trajectory) if rate else None
+
+    path = Path(csv_path).with_suffix(SUFFIX)
+    save(path, trajectory, samples, rate, profile, (sampler.max_speed, sampler.max_acceleration))
+    return path
+
+
+def main() -> None:
+
+    """ python -m robot_control.trajectory_file final.csv 'teste*_ultimate.csv' [--rate 10] """
+
+    args = sys.argv[1:]
+    rate = 10
+    if "--rate" in args:
+        i = args.index("--rate")
+        rate = float(args[i + 1])
+        del args[i:i + 2]
+
+    for pattern in args:
+        for name in sorted(glob(pattern)) or [pattern]:
+            path = convert(name, rate=rate)
+            _, samples, _ = load(path)
+            print(f"{name} -> {path} ({0 if samples is None else len(samples[0])} samples)")
+
+
+if __name__ == "__main__":
+    main()
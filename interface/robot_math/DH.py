@@ -1,28 +1,47 @@
 # %%
 
+import hashlib
+import importlib.util
+import json
+import os
+from pathlib import Path
+from time import perf_counter
+
 import numpy as np
 import pandas as pd
-import scipy as sp
-from scipy.optimize import least_squares
-import sympy as sym
 
 b1 = np.arctan(148 / 28)
 b2 = np.sqrt(148**2 + 28**2)
 b3 = np.arctan(48 / 152)
 b4 = np.sqrt(48**2 + 152**2)
 
-joints = sym.symbols("theta_1:4")
+# Distance to a singularity below which the numeric solver is used
+singular_tol = 1e-6
 
-# Denavit-Hartenberg Table
+# Denavit-Hartenberg Table, theta is the offset added to each joint angle
 DH_table = pd.DataFrame(
     data={
         "a": [0, b2, b4],
-        "alpha": [sym.pi / 2, 0, 0],
+        "alpha": [np.pi / 2, 0, 0],
         "d": [165, 0, 0],
-        "theta": [joints[0], joints[1] + b1, joints[2] + b3 - b1],
+        "theta": [0, b1, b3 - b1],
     }
 )
 
+# Mechanical range (rad) of each joint, the base turns freely
+joint_ranges = np.array(
+    [
+        [-np.pi, np.pi],
+        [-np.pi / 2, np.pi / 2],
+        [-3 * np.pi / 4, 3 * np.pi / 4],
+    ]
+)
+
+# Generated kinematics, one module per DH table
+cache_dir = Path(__file__).parent / "kinematics_cache"
+codegen_version = 1
+_loaded = {}
+
 
 def cum_prod(l):
     result = [l[0]]
@@ -36,7 +55,52 @@ def d(A):
     return A[:3, 3]
 
 
+def wrap_near(angles, reference):
+    """Shifts angles by multiples of 2*pi to be closest to reference"""
+    return angles + 2 * np.pi * np.round((reference - angles) / (2 * np.pi))
+
+
+def free_joints(ranges):
+    """Joints whose range covers a whole turn"""
+    ranges = np.asarray(ranges, dtype=float)
+    return ranges[:, 1] - ranges[:, 0] >= 2 * np.pi - 1e-9
+
+
+def within_ranges(solutions, ranges):
+    """Rows of solutions with every bounded joint in its range, shifted by
+    whole turns into it. Free joints are left as they are"""
+    ranges = np.asarray(ranges, dtype=float)
+    bounded = ~free_joints(ranges)
+    solutions = np.array(solutions, dtype=float).reshape(-1, len(ranges))
+    low, high = ranges[bounded, 0], ranges[bounded, 1]
+    angles = wrap_near(solutions[:, bounded], (low + high) / 2)
+    solutions[:, bounded] = angles
+    keep = ((angles >= low - 1e-9) & (angles <= high + 1e-9)).all(axis=1)
+    return solutions[keep]
+
+
+def closest_solution(solutions, last_pos, ranges=None):
+    """Returns the row of solutions closest to last_pos in joint space
+
+    With ranges, only the rows within them are considered (None if there
+    is none) and only the free joints are wrapped near last_pos.
+    """
+    last_pos = np.asarray(last_pos, dtype=float)
+    if ranges is None:
+        solutions = wrap_near(solutions, last_pos)
+    else:
+        solutions = within_ranges(solutions, ranges)
+        if len(solutions) == 0:
+            return None
+        free = free_joints(ranges)
+        solutions[:, free] = wrap_near(solutions[:, free], last_pos[free])
+    diff = solutions - last_pos
+    return solutions[np.argmin(np.einsum("ij,ij->i", diff, diff))]
+
+
 def calculate_homogeneous_matrix(theta, alpha, a, d):
+    import sympy as sym
+
     ct = sym.cos(theta)
     st = sym.sin(theta)
     ca = sym.cos(alpha)
@@ -55,44 +119,253 @@ def calculate_homogeneous_matrix(theta, alpha, a, d):
     return Ai
 
 
+def table_hash(table):
+    """Hash identifying a DH table and the code generator version"""
+    content = json.dumps(
+        {"version": codegen_version, "table": table.to_dict(orient="list")},
+        sort_keys=True,
+        default=float,
+    )
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def generate_kinematics(table):
+    """Derives the kinematics symbolically and returns it as NumPy code
+
+    The generated module has the functions homogeneous_matrices, joints_pos,
+    last_pos and jacobian, all taking the joint angles as arguments and
+    returning a flat list of elements in row-major order.
+    """
+    import sympy as sym
+    from sympy.printing.numpy import NumPyPrinter
+
+    joints = sym.symbols(f"theta_1:{len(table) + 1}")
+    homogeneus_matrices = [
+        calculate_homogeneous_matrix(
+            theta=joints[i] + row["theta"],
+            alpha=sym.nsimplify(row["alpha"], [sym.pi]),
+            a=row["a"],
+            d=row["d"],
+        )
+        for i, row in table.iterrows()
+    ]
+    A_0_i = cum_prod(homogeneus_matrices)
+    last_pos = d(A_0_i[-1])
+
+    functions = {
+        "homogeneous_matrices": [e for A in A_0_i for e in A],
+        "joints_pos": [e for A in A_0_i for e in d(A)],
+        "last_pos": list(last_pos),
+        "jacobian": list(last_pos.jacobian(joints)),
+    }
+
+    printer = NumPyPrinter()
+    args = ", ".join(str(q) for q in joints)
+    lines = [
+        f"# Generated by robot_math.DH for DH table {table_hash(table)}",
+        "# Do not edit, delete the file to regenerate it",
+        "",
+        "import numpy",
+    ]
+    for name, elements in functions.items():
+        replacements, reduced = sym.cse(elements)
+        lines += ["", "", f"def {name}({args}):"]
+        lines += [f"    {s} = {printer.doprint(e)}" for s, e in replacements]
+        lines += [f"    return [{', '.join(printer.doprint(e) for e in reduced)}]"]
+    return "\n".join(lines) + "\n"
+
+
+def load_kinematics(table):
+    """Loads the generated kinematics of table, generating it if needed"""
+    key = table_hash(table)
+    if key not in _loaded:
+        path = cache_dir / f"kinematics_{key}.py"
+        if not path.exists():
+            cache_dir.mkdir(exist_ok=True)
+            temp = path.with_suffix(f".{os.getpid()}.tmp")
+            temp.write_text(generate_kinematics(table))
+            os.replace(temp, path)
+
+        spec = importlib.util.spec_from_file_location(path.stem, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _loaded[key] = module
+    return _loaded[key]
+
+
 class DH:
     def __init__(self):
         self.table = DH_table
-        self.joints = joints
-
-        self.homogeneus_matrices = [
-            calculate_homogeneous_matrix(**dict(self.table.iloc[i]))
-            for i in range(len(self.table))
-        ]
-        temp = cum_prod(self.homogeneus_matrices)
-        self.A_0_i = [Expr(A, joints) for A in temp]
+        n = len(self.table)
 
+        kinematics = load_kinematics(self.table)
+        self.A_0_i = Expr(kinematics.homogeneous_matrices, (n, 4, 4))
+        self.__joints_pos = Expr(kinematics.joints_pos, (n, 3))
         # TODO change name to last joint pos
-        self.__last_pos = Expr(d(self.A_0_i[-1].symbolic), joints)
-        # self.last_pos = Expr(d(self.A_0_i[-1].symbolic), joints)
+        self.__last_pos = Expr(kinematics.last_pos, (3,))
+        self.__jacobian = Expr(kinematics.jacobian, (3, n))
+
+        # Mechanical range of each joint, respected by the inverse kinematics
+        self.ranges = joint_ranges
+
+        # Geometry used by the closed-form inverse kinematics
+        self.d1 = float(self.table["d"][0])
+        self.a2 = float(self.table["a"][1])
+        self.a3 = float(self.table["a"][2])
+        self.offsets = [float(theta) for theta in self.table["theta"]]
 
     def fw_kinematics(self, joints):
-        all_joints = np.array([[0,0,0]]+[d(Ai(joints)) for Ai in self.A_0_i])
+        all_joints = np.vstack([[0, 0, 0], self.__joints_pos(joints)])
         return (all_joints[:,0], all_joints[:,1], all_joints[:,2])
 
+    def fw_kinematics_batch(self, q):
+        """Position of all joints (base included) for N configurations
+
+        q has shape (N, 3) and the result (N, 4, 3), with the base at the
+        origin and the manipulator in the last row of each configuration.
+        """
+        q = np.asarray(q, dtype=float)
+        result = np.zeros((len(q), len(self.table) + 1, 3))
+        result[:, 1:] = self.__joints_pos.batch(q)
+        return result
+
     def bw_kinematics(self, target, last_pos):
-        a = least_squares(lambda x: target - self.last_pos(x), last_pos)
+        """Inverse kinematics, returns the solution within the joint ranges
+        closest to last_pos
+
+        Uses the closed-form solver and only falls back to the numeric one
+        when the target is close to a singularity, out of reach or only
+        reachable out of the joint ranges.
+        """
+        solution = closest_solution(self.ik_solutions(target), last_pos, self.ranges)
+        if solution is None:
+            return self.numeric_bw_kinematics(target, last_pos)
+        return solution
+
+    def numeric_bw_kinematics(self, target, last_pos):
+        """Least squares inverse kinematics from last_pos, bounded joints
+        kept within their range"""
+        from scipy.optimize import least_squares
+
+        bounded = ~free_joints(self.ranges)
+        low = np.where(bounded, self.ranges[:, 0], -np.inf)
+        high = np.where(bounded, self.ranges[:, 1], np.inf)
+
+        # The start must be within the bounds
+        start = np.array(last_pos, dtype=float)
+        start[bounded] = wrap_near(start[bounded], self.ranges[bounded].mean(axis=1))
+        start = np.clip(start, low, high)
+
+        a = least_squares(lambda x: target - self.last_pos(x), start, bounds=(low, high))
         return a.x
 
+    def path_bw_kinematics(
+        self, targets, last_pos, damping=1e-2, tol=1e-6, max_iter=50
+    ):
+        """Inverse kinematics of a Cartesian path, shape (N, 3)
+
+        Each point is solved with damped least squares starting from the
+        solution of the previous one (last_pos for the first point).
+
+        Returns the joint angles (N, 3), the residual distance of each point
+        and the throughput in points per second.
+        """
+        targets = np.asarray(targets, dtype=float)
+        solutions = np.empty((len(targets), 3))
+        residuals = np.empty(len(targets))
+        damping_matrix = damping**2 * np.eye(3)
+
+        q = np.array(last_pos, dtype=float)
+        start = perf_counter()
+        for i, target in enumerate(targets):
+            for _ in range(max_iter):
+                error = target - self.last_pos(q)
+                if np.dot(error, error) < tol**2:
+                    break
+                J = self.jacobian(q)
+                q = q + J.T @ np.linalg.solve(J @ J.T + damping_matrix, error)
+            else:
+                error = target - self.last_pos(q)
+            solutions[i] = q
+            residuals[i] = np.sqrt(np.dot(error, error))
+        elapsed = perf_counter() - start
+
+        rate = len(targets) / elapsed if elapsed > 0 else float("inf")
+        return solutions, residuals, rate
+
+    def ik_solutions(self, target):
+        """All closed-form solutions (base flip x elbow up/down) of target
+
+        Returns an empty (0, 3) array near singularities (manipulator over
+        the base axis, arm fully stretched or folded) and out of reach.
+        """
+        x, y, z = target
+        rho = np.hypot(x, y)
+        h = z - self.d1
+        if rho < singular_tol:
+            return np.empty((0, 3))
+
+        c3 = (rho**2 + h**2 - self.a2**2 - self.a3**2) / (2 * self.a2 * self.a3)
+        if abs(c3) > 1 - singular_tol:
+            return np.empty((0, 3))
+        s3 = np.sqrt(1 - c3**2)
+
+        solutions = []
+        for q1, r in ((np.arctan2(y, x), rho), (np.arctan2(-y, -x), -rho)):
+            for theta3 in (np.arctan2(s3, c3), np.arctan2(-s3, c3)):
+                theta2 = np.arctan2(h, r) - np.arctan2(
+                    self.a3 * np.sin(theta3), self.a2 + self.a3 * np.cos(theta3)
+                )
+                solutions.append(
+                    (q1, theta2 - self.offsets[1], theta3 - self.offsets[2])
+                )
+        return np.array(solutions)
+
     def last_pos(self, joints):
         return self.__last_pos.numeric(joints)
 
+    def jacobian(self, joints):
+        return self.__jacobian.numeric(joints)
+
+    def last_pos_batch(self, q):
+        """Manipulator position, shape (N, 3), for N configurations"""
+        return self.__last_pos.batch(np.asarray(q, dtype=float))
+
+    def planar_batch(self, q2, q3):
+        """Elbow and manipulator in the plane of the arm, for N configurations
+
+        Returns (r_elbow, z_elbow, r_end, z_end), r along the direction the
+        base points to. The base angle only rotates this plane, so shoulder
+        and elbow angles are enough for heights and self-distances.
+        """
+        shoulder = np.asarray(q2, dtype=float) + self.offsets[1]
+        forearm = shoulder + np.asarray(q3, dtype=float) + self.offsets[2]
+        r_elbow = self.a2 * np.cos(shoulder)
+        z_elbow = self.d1 + self.a2 * np.sin(shoulder)
+        r_end = r_elbow + self.a3 * np.cos(forearm)
+        z_end = z_elbow + self.a3 * np.sin(forearm)
+        return r_elbow, z_elbow, r_end, z_end
+
 
 class Expr:
-    def __init__(self, symbolic, vars_):
-        self.symbolic = symbolic
-        self.vars_ = vars_
-        self._num_lambdify = sym.lambdify(vars_, symbolic)
-        self.numeric = lambda x: self._num_lambdify(*x).squeeze()
+    """Numeric expression generated by generate_kinematics"""
+
+    def __init__(self, function, shape):
+        self.function = function
+        self.shape = shape
+        self.numeric = lambda x: np.array(self.function(*x), dtype=float).reshape(
+            self.shape
+        )
 
     def __call__(self, x):
         return self.numeric(x)
 
+    def batch(self, x):
+        """Evaluates the expression for every row of x, shape (N, vars)"""
+        values = self.function(*x.T)
+        flat = np.stack([np.broadcast_to(v, len(x)) for v in values], axis=-1)
+        return flat.reshape((len(x),) + self.shape)
+
 
 # %%
 
@@ -109,25 +382,39 @@ def main() -> None:
 
     points = line_points([180, 0, 360], [181, 0, 360 / 2], 2000)
 
-    q_old = [0, 0, 0]
-
     rb = DH()
 
     def ssd(a, b):
         diff = a - b
         return np.dot(diff, diff)
 
-    for p in points:
-        q = rb.bw_kinematics(p, q_old)
-        q_old = q
-        # print(ssd(p, rb.fw_kinematics(q)[-1]))
+    for name, solver in (
+        ("least_squares", rb.numeric_bw_kinematics),
+        ("analytic", rb.bw_kinematics),
+    ):
+        q_old = [0, 0, 0]
+        solutions = []
+        start = perf_counter()
+        for p in points:
+            q = solver(p, q_old)
+            q_old = q
+            solutions.append(q)
+        elapsed = perf_counter() - start
+        error = max(ssd(p, rb.last_pos(q)) for p, q in zip(points, solutions))
+        print(
+            f"{name:>14}: {elapsed * 1e3:8.1f} ms total, "
+            f"{elapsed / len(points) * 1e6:8.1f} us/point, "
+            f"max sq. error {error:.2e}"
+        )
+
+    _, residuals, rate = rb.path_bw_kinematics(points, [0, 0, 0])
+    print(
+        f"{'path (DLS)':>14}: {len(points) / rate * 1e3:8.1f} ms total, "
+        f"{rate:8.0f} points/s, max error {residuals.max():.2e}"
+    )
 
 
 if __name__ == "__main__":
     main()
     pass
 
-# %%
-dh = DH()
-dh.fw_kinematics((0,0,0))
-# %%
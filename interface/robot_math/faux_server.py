@@ -1,73 +1,70 @@
-import random
-from time import time
+"""
+Stand-in Ev3 that only plots the arm at the received setpoints.
 
-import matplotlib.pyplot as plt
-import numpy as np
+Speaks the same protocol as Ev3/main.py (Ev3Server answers HELLO and the
+heartbeats) but moves no motors and sends no telemetry, see
+Ev3/simulator.py for a simulated Ev3. Run from the robot_math folder:
 
-from Com import Com
-from DH import DH
+    python faux_server.py
+"""
 
-HOST = "localhost"
-PORT = 12345
-
-
-class ParseError(Exception):
-    pass
+import os
+import sys
 
+import matplotlib.pyplot as plt
+import numpy as np
 
-def parse(msg):
-    try:
-        msg = msg.decode("ASCII").split("#")
-        decoded = [float(x) for x in msg[1].split(";")]
-        if len(decoded) != 4:
-            raise ValueError
-    except Exception as error:
-        raise ParseError(repr(error))
+from DH import DH
 
-    return decoded
+# Ev3 modules import each other as top level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Ev3"))
 
+from protocol import SETPOINT, WAYPOINT
+from server import Ev3Server
 
-def split_3d_point_array(array):
-    return np.array([array[:, 0], array[:, 1], array[:, 2]])
+HOST = "localhost"
+PORT = 12345
 
 
 def main() -> None:
-    # robot = Robot()
-
     r = DH()
 
-    com = Com(HOST, PORT)
-    rec = com.receive(1024)
+    # Setpoints arrive in the server thread, only the newest is drawn
+    latest = {"joints": None, "received": 0}
+
+    def handle(kind, value):
+        if kind in (SETPOINT, WAYPOINT):
+            latest["joints"] = value.joints
+            latest["received"] += 1
+
+    server = Ev3Server(HOST, PORT, handle)
+    server.start()
     print("*" * 20, "Ready", "*" * 20, sep="\n")
-    last_time = time()
 
     ax = plt.figure().add_subplot(projection="3d")
-    (line,) = ax.plot(
-        *np.hsplit(r.fw_kinematics([0, 0, 0]), 3)
-    )  # Update the line object with new data
-
-    while True:
-        msg = next(rec)
-        try:
-            joints = parse(msg)
-            print(joints)
-            # robot.move(*joints)
-            # t = time()
-            # print(t - last_time)
-            # last_time = t
-        except ParseError as error:
-            print(repr(error))  # Might be slow
-            pass  # Ignore errors in communincation
-        except KeyboardInterrupt:
-            break
-        (x, y, z) = split_3d_point_array(r.fw_kinematics(joints[:3]))
-        line.set_data(x, y)
-        line.set_3d_properties(z)
-
-        ax.relim()  # Recalculate the data limits
-        ax.autoscale_view()  # Autoscale the axes
-        plt.draw()  # Redraw the plot
-        plt.pause(0.1)  # Pause to allow the plot to be displayed
+    (line,) = ax.plot(*r.fw_kinematics([0, 0, 0]))  # Updated with every setpoint
+
+    drawn = 0
+    try:
+        while plt.get_fignums():
+            if latest["received"] != drawn:
+                drawn = latest["received"]
+                joints = latest["joints"]
+                print(joints)
+
+                # The interface sends degrees
+                (x, y, z) = r.fw_kinematics(np.radians(joints[:3]))
+                line.set_data(x, y)
+                line.set_3d_properties(z)
+
+                ax.relim()  # Recalculate the data limits
+                ax.autoscale_view()  # Autoscale the axes
+                plt.draw()  # Redraw the plot
+            plt.pause(0.1)  # Pause to allow the plot to be displayed
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
 
 
 if __name__ == "__main__":
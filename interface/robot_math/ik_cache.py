@@ -0,0 +1,130 @@
+# %%
+
+import math
+from collections import OrderedDict
+from time import perf_counter
+
+import numpy as np
+
+from robot_math.DH import DH, free_joints, within_ranges
+
+# Targets closer than this (mm) share a cache entry, far below what the Ev3
+# can position and a fiftieth of the joystick step
+ik_quantum = 0.1
+ik_cache_size = 4096
+
+
+class IKCache:
+    """Bounded LRU cache of inverse kinematics solutions
+
+    The joystick moves in fixed steps, so the same targets are solved over
+    and over. The closed-form solutions of a target within the joint ranges
+    (every base and elbow branch) are cached under the target quantized to
+    quantum, and each hit picks the one closest to last_pos as bw_kinematics
+    does, so the branch follows the arm. A hit differs from a fresh solve
+    only by the target moving within its quantum. Targets needing the
+    numeric solver, whose result depends on last_pos, are never cached.
+    """
+
+    def __init__(self, dh=None, size=ik_cache_size, quantum=ik_quantum):
+        self.dh = DH() if dh is None else dh
+        self.size = size
+        self.quantum = quantum
+        self.entries = OrderedDict()
+        self.free = tuple(bool(free) for free in free_joints(self.dh.ranges))
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, target):
+        return tuple(int(round(p / self.quantum)) for p in target)
+
+    def closest(self, solutions, last_pos):
+        """closest_solution() on Python floats, cheaper for a few rows. The
+        solutions are within the ranges, only the free joints are wrapped"""
+        turn = 2 * math.pi
+        l1, l2, l3 = last_pos
+        f1, f2, f3 = self.free
+        best, best_distance = None, math.inf
+        for s1, s2, s3 in solutions:
+            if f1:
+                s1 += turn * round((l1 - s1) / turn)
+            if f2:
+                s2 += turn * round((l2 - s2) / turn)
+            if f3:
+                s3 += turn * round((l3 - s3) / turn)
+            distance = (s1 - l1) ** 2 + (s2 - l2) ** 2 + (s3 - l3) ** 2
+            if distance < best_distance:
+                best, best_distance = (s1, s2, s3), distance
+        return np.array(best)
+
+    def solve(self, target, last_pos):
+        """bw_kinematics(target, last_pos), from the cache when possible"""
+        # Python floats, scalar math on NumPy scalars costs more than the lookup
+        target = np.asarray(target, dtype=float).tolist()
+        last_pos = np.asarray(last_pos, dtype=float).tolist()
+        key = self.key(target)
+        solutions = self.entries.get(key)
+        if solutions is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.closest(solutions, last_pos)
+
+        self.misses += 1
+        solutions = within_ranges(self.dh.ik_solutions(target), self.dh.ranges)
+        if len(solutions) == 0:
+            return self.dh.numeric_bw_kinematics(np.asarray(target), last_pos)
+
+        self.entries[key] = solutions.tolist()
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return self.closest(self.entries[key], last_pos)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+    def statistics(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# %%
+
+
+def main() -> None:
+    cache = IKCache()
+    dh = cache.dh
+
+    # Joystick jogging back and forth over a 50 mm square, 5 mm steps
+    start = np.array([180.0, 0.0, 200.0])
+    steps = np.arange(11) * 5.0
+    path = [start + [dx, dy, 0] for dy in steps for dx in (steps if dy % 10 == 0 else steps[::-1])]
+    path = path + path[::-1]
+
+    def jog(solver):
+        q = np.zeros(3)
+        solutions = []
+        begin = perf_counter()
+        for target in path:
+            q = solver(target, q)
+            solutions.append(q)
+        return (perf_counter() - begin) / len(path), np.array(solutions)
+
+    uncached, expected = jog(dh.bw_kinematics)
+    first, _ = jog(cache.solve)
+    second, solutions = jog(cache.solve)
+
+    print(f"{'bw_kinematics':>14}: {uncached * 1e6:8.1f} us/step")
+    print(f"{'first pass':>14}: {first * 1e6:8.1f} us/step")
+    print(f"{'second pass':>14}: {second * 1e6:8.1f} us/step")
+    print(f"cache: {cache.statistics()}")
+    print(f"max difference with bw_kinematics: {np.abs(solutions - expected).max():.2e} rad")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Tests of the forward and inverse kinematics.
+
+    python -m pytest robot_math/test_DH.py    (from the interface folder)
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from robot_math.DH import DH, joint_ranges
+
+
+@pytest.fixture(scope="module")
+def dh():
+    return DH()
+
+
+@pytest.fixture(scope="module")
+def configurations():
+    # Inside the joint ranges, away from the singularities
+    rng = np.random.default_rng(0)
+    return rng.uniform(joint_ranges[:, 0], joint_ranges[:, 1], (50, 3)) * 0.9
+
+
+def test_every_closed_form_branch_reaches_the_target(dh, configurations):
+    for q in configurations:
+        target = dh.last_pos(q)
+        solutions = dh.ik_solutions(target)
+        assert solutions.shape == (4, 3)
+        for solution in solutions:
+            np.testing.assert_allclose(dh.last_pos(solution), target, atol=1e-6)
+        # Base flipped by half a turn, elbow up and down
+        assert len({tuple(np.round(s, 6)) for s in solutions}) == 4
+
+
+def test_bw_kinematics_keeps_the_branch_of_last_pos(dh, configurations):
+    for q in configurations:
+        np.testing.assert_allclose(dh.bw_kinematics(dh.last_pos(q), q + 0.01), q, atol=1e-6)
+
+
+def test_bw_kinematics_wraps_the_base_near_last_pos(dh):
+    q = np.array([0.5, 0.3, -0.4])
+    solution = dh.bw_kinematics(dh.last_pos(q), q + [2 * np.pi, 0, 0])
+    np.testing.assert_allclose(solution, q + [2 * np.pi, 0, 0], atol=1e-6)
+
+
+def test_singular_and_unreachable_targets(dh):
+    over_the_base = np.array([0.0, 0.0, 300.0])
+    assert dh.ik_solutions(over_the_base).shape == (0, 3)
+    solution = dh.bw_kinematics(over_the_base, [0.1, 0.2, 0.3])
+    np.testing.assert_allclose(dh.last_pos(solution), over_the_base, atol=1e-3)
+
+    assert dh.ik_solutions([1000.0, 0.0, 0.0]).shape == (0, 3)
+
+
+def test_batches_match_the_single_configuration_kinematics(dh, configurations):
+    positions = dh.fw_kinematics_batch(configurations)
+    np.testing.assert_allclose(positions[:, -1], dh.last_pos_batch(configurations))
+    for q, joints in zip(configurations, positions):
+        np.testing.assert_allclose(np.column_stack(dh.fw_kinematics(q)), joints, atol=1e-9)
+
+    # Elbow and manipulator in the plane of the arm
+    r_elbow, z_elbow, r_end, z_end = dh.planar_batch(configurations[:, 1], configurations[:, 2])
+    elbow, end = positions[:, 2], positions[:, 3]
+    base = np.column_stack([np.cos(configurations[:, 0]), np.sin(configurations[:, 0])])
+    np.testing.assert_allclose(np.einsum("ij,ij->i", elbow[:, :2], base), r_elbow, atol=1e-9)
+    np.testing.assert_allclose(np.einsum("ij,ij->i", end[:, :2], base), r_end, atol=1e-9)
+    np.testing.assert_allclose(elbow[:, 2], z_elbow, atol=1e-9)
+    np.testing.assert_allclose(end[:, 2], z_end, atol=1e-9)
+
+
+def test_bw_kinematics_respects_the_joint_ranges(dh):
+    low, high = joint_ranges[1:, 0], joint_ranges[1:, 1]
+    rng = np.random.default_rng(1)
+    for q in rng.uniform(-np.pi, np.pi, (50, 3)):
+        target = dh.last_pos(q)
+        solution = dh.bw_kinematics(target, rng.uniform(-np.pi, np.pi, 3))
+        assert np.all(solution[1:] >= low - 1e-9) and np.all(solution[1:] <= high + 1e-9)
+
+
+def test_numeric_bw_kinematics_starts_within_the_ranges(dh):
+    q = np.array([0.3, 0.2, -0.4])
+    solution = dh.numeric_bw_kinematics(dh.last_pos(q), [0.3, 3.0, -3.0])
+    np.testing.assert_allclose(dh.last_pos(solution), dh.last_pos(q), atol=1e-3)
+    assert abs(solution[1]) <= np.pi / 2 and abs(solution[2]) <= 3 * np.pi / 4
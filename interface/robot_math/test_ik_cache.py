@@ -0,0 +1,70 @@
+"""
+Tests of the inverse kinematics cache.
+
+    python -m pytest robot_math/test_ik_cache.py    (from the interface folder)
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from robot_math.DH import DH
+from robot_math.ik_cache import IKCache
+
+
+@pytest.fixture(scope="module")
+def dh():
+    return DH()
+
+
+def test_hits_match_bw_kinematics(dh):
+    cache = IKCache(dh)
+    q = np.array([0.4, 0.2, -0.5])
+    target = dh.last_pos(q)
+    for last_pos in (q + 0.01, q + [np.pi, 0, 0], q + [2 * np.pi, 0, 0]):
+        np.testing.assert_allclose(
+            cache.solve(target, last_pos), dh.bw_kinematics(target, last_pos), atol=1e-9
+        )
+    assert cache.statistics()["hits"] == 2
+    assert cache.statistics()["misses"] == 1
+
+
+def test_solutions_out_of_the_joint_ranges_are_skipped(dh):
+    cache = IKCache(dh)
+    q = np.array([0.4, 0.2, -0.5])
+    # The branch with the base turned by pi has the shoulder out of its range
+    solution = cache.solve(dh.last_pos(q), q + [np.pi, 0, 0])
+    np.testing.assert_allclose(solution, dh.bw_kinematics(dh.last_pos(q), q + [np.pi, 0, 0]))
+    assert all(abs(s[1]) <= np.pi / 2 for s in cache.entries[cache.key(dh.last_pos(q))])
+
+
+def test_targets_within_the_quantum_share_an_entry(dh):
+    cache = IKCache(dh, quantum=0.1)
+    target = np.round(dh.last_pos([0.4, 0.2, -0.5]), 1)  # Center of its quantum
+    cache.solve(target, [0, 0, 0])
+    cache.solve(target + 0.01, [0, 0, 0])
+    cache.solve(target + 1.0, [0, 0, 0])
+    assert cache.statistics() == {"hits": 1, "misses": 2, "entries": 2, "hit_rate": 1 / 3}
+
+
+def test_least_recently_used_entries_are_evicted(dh):
+    cache = IKCache(dh, size=2)
+    targets = [dh.last_pos([0.1 * i, 0.2, -0.5]) for i in range(3)]
+    cache.solve(targets[0], [0, 0, 0])
+    cache.solve(targets[1], [0, 0, 0])
+    cache.solve(targets[0], [0, 0, 0])  # Now the most recently used
+    cache.solve(targets[2], [0, 0, 0])
+    assert cache.key(targets[0]) in cache.entries
+    assert cache.key(targets[1]) not in cache.entries
+
+
+def test_numeric_solutions_are_not_cached(dh):
+    cache = IKCache(dh)
+    over_the_base = np.array([0.0, 0.0, 300.0])
+    solution = cache.solve(over_the_base, [0.1, 0.2, 0.3])
+    np.testing.assert_allclose(dh.last_pos(solution), over_the_base, atol=1e-3)
+    assert cache.statistics()["entries"] == 0
@@ -0,0 +1,225 @@
+# %%
+
+import hashlib
+import os
+from time import perf_counter
+
+import numpy as np
+
+from robot_math.DH import DH, cache_dir, joint_ranges, table_hash
+
+# Edge of a voxel of the reachability grid (mm), the joystick step
+voxel_size = 5.0
+workspace_version = 1
+
+# Voxel values, how the base reaches the voxel
+UNREACHABLE = 0
+FORWARD = 1  # Base angle pointing at the voxel
+BACKWARD = 2  # Base turned by pi, the arm leaning over the base axis
+
+
+def workspace_key(table, ranges, size):
+    """Hash identifying a reachability grid"""
+    content = repr((workspace_version, table_hash(table), ranges.tolist(), size))
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def save_atomic(path, array):
+    temp = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(temp, "wb") as f:
+        np.save(f, array)
+    os.replace(temp, path)
+
+
+def in_range(angles, low, high):
+    """Whether the angles, modulo 2*pi, are within [low, high]"""
+    return (angles - low) % (2 * np.pi) <= high - low
+
+
+class Workspace:
+    """Reachable workspace of the arm as a voxel grid
+
+    The grid is built once per DH table and joint ranges and kept on disk
+    as memory-mapped arrays. The arm is symmetric around the base axis, so
+    the shoulder and elbow are swept (batch FK, every joint above the
+    ground) to map the reachable (r, z) profile and each voxel is reachable
+    if its profile cell is, with the base angle pointing at it or away from
+    it. A nearest reachable voxel is stored for every voxel, so both
+    reachability and projection are O(1).
+    """
+
+    def __init__(self, dh=None, ranges=joint_ranges, size=voxel_size):
+        self.dh = DH() if dh is None else dh
+        self.ranges = np.asarray(ranges, dtype=float)
+        self.size = size
+
+        # Grid bounds, the arm fully stretched around the shoulder
+        table = self.dh.table
+        reach = float(table["a"].sum())
+        height = float(table["d"][0]) + reach
+        self.origin = np.array([-reach, -reach, 0.0])
+        self.shape = tuple(
+            int(np.ceil(extent / size)) for extent in (2 * reach, 2 * reach, height)
+        )
+
+        key = workspace_key(table, self.ranges, size)
+        paths = {
+            name: cache_dir / f"workspace_{key}_{name}.npy"
+            for name in ("profile", "occupancy", "nearest")
+        }
+        if not all(path.exists() for path in paths.values()):
+            cache_dir.mkdir(exist_ok=True)
+            for name, array in zip(("profile", "occupancy", "nearest"), self.build()):
+                save_atomic(paths[name], array)
+
+        self.profile = np.load(paths["profile"], mmap_mode="r")
+        self.occupancy = np.load(paths["occupancy"], mmap_mode="r")
+        self.nearest = np.load(paths["nearest"], mmap_mode="r")
+
+    def build(self):
+        """Computes the (r, z) profile, the voxel occupancy and the nearest
+        reachable voxel of every voxel"""
+        from scipy.ndimage import distance_transform_edt
+
+        # Sweep steps of a quarter voxel at the end of the arm
+        reach = -self.origin[0]
+        (_, _), (q2_low, q2_high), (q3_low, q3_high) = self.ranges
+        step = self.size / (4 * reach)
+        q2 = np.linspace(q2_low, q2_high, int(np.ceil((q2_high - q2_low) / step)) + 1)
+        q3 = np.linspace(q3_low, q3_high, int(np.ceil((q3_high - q3_low) / step)) + 1)
+        q = np.stack(np.meshgrid(0.0, q2, q3, indexing="ij"), axis=-1).reshape(-1, 3)
+
+        positions = self.dh.fw_kinematics_batch(q)
+        positions = positions[np.all(positions[:, :, 2] >= 0, axis=1)]
+        r, z = positions[:, -1, 0], positions[:, -1, 2]  # Base angle 0, y = 0
+
+        # Profile cells (signed r, z), represented by the sample closest to
+        # their center, NaN when unreachable
+        cells = ((r - self.origin[0]) // self.size).astype(int), (z // self.size).astype(int)
+        center = ((cells[0] + 0.5) * self.size + self.origin[0], (cells[1] + 0.5) * self.size)
+        distance = (r - center[0]) ** 2 + (z - center[1]) ** 2
+        cell = np.ravel_multi_index(cells, (self.shape[0], self.shape[2]))
+        order = np.lexsort((distance, cell))
+        first = order[np.unique(cell[order], return_index=True)[1]]
+
+        profile = np.full((self.shape[0], self.shape[2], 2), np.nan, dtype=np.float32)
+        profile.reshape(-1, 2)[cell[first]] = np.column_stack([r[first], z[first]])
+
+        # Voxels from their center
+        x, y, z = self.centers(np.indices(self.shape).reshape(3, -1).T).T
+        rho, phi = np.hypot(x, y), np.arctan2(y, x)
+        z_cell = (z // self.size).astype(int)
+
+        def reachable_cell(r):
+            r_cell = ((r - self.origin[0]) // self.size).astype(int)
+            inside = (r_cell >= 0) & (r_cell < self.shape[0])
+            r_cell = np.clip(r_cell, 0, self.shape[0] - 1)
+            return inside & ~np.isnan(profile[r_cell, z_cell, 0])
+
+        (q1_low, q1_high) = self.ranges[0]
+        occupancy = np.full(len(x), UNREACHABLE, dtype=np.uint8)
+        backward = in_range(phi + np.pi, q1_low, q1_high) & reachable_cell(-rho)
+        occupancy[backward] = BACKWARD
+        forward = in_range(phi, q1_low, q1_high) & reachable_cell(rho)
+        occupancy[forward] = FORWARD
+        occupancy = occupancy.reshape(self.shape)
+
+        # Index of the closest reachable voxel, themselves for the reachable
+        nearest = distance_transform_edt(
+            occupancy == UNREACHABLE, return_distances=False, return_indices=True
+        )
+        nearest = np.moveaxis(nearest, 0, -1).astype(np.int16)
+        return profile, occupancy, nearest
+
+    def centers(self, indices):
+        """Centers of the voxels, indices of shape (N, 3)"""
+        return self.origin + (np.asarray(indices) + 0.5) * self.size
+
+    def voxel(self, point):
+        """Index of the voxel holding point, None out of the grid"""
+        index = tuple(int((p - o) // self.size) for p, o in zip(point, self.origin))
+        if all(0 <= i < n for i, n in zip(index, self.shape)):
+            return index
+        return None
+
+    def is_reachable(self, point):
+        index = self.voxel(point)
+        return index is not None and self.occupancy[index] != UNREACHABLE
+
+    def project(self, point):
+        """point if reachable, otherwise a reachable point of the nearest
+        reachable voxel"""
+        index = self.voxel(point)
+        if index is not None and self.occupancy[index] != UNREACHABLE:
+            return np.asarray(point, dtype=float)
+
+        # Out of the grid, start from the closest voxel of its border
+        index = tuple(
+            min(max(int((p - o) // self.size), 0), n - 1)
+            for p, o, n in zip(point, self.origin, self.shape)
+        )
+        return self.representative(tuple(self.nearest[index]))
+
+    def representative(self, index):
+        """Reachable point of a reachable voxel, from its profile cell"""
+        x, y, z = self.centers(index)
+        rho, phi = np.hypot(x, y), np.arctan2(y, x)
+        if self.occupancy[index] == BACKWARD:
+            rho, phi = -rho, phi + np.pi
+        r, z = self.profile[int((rho - self.origin[0]) // self.size), index[2]]
+        return np.array([r * np.cos(phi), r * np.sin(phi), z], dtype=float)
+
+    def reachable(self, points):
+        """Reachability of each point, points of shape (N, 3)"""
+        points = np.asarray(points, dtype=float)
+        index = ((points - self.origin) // self.size).astype(int)
+        inside = np.all((index >= 0) & (index < self.shape), axis=1)
+        result = np.zeros(len(points), dtype=bool)
+        index = index[inside]
+        result[inside] = self.occupancy[index[:, 0], index[:, 1], index[:, 2]] != UNREACHABLE
+        return result
+
+
+# %%
+
+
+def main() -> None:
+    for path in cache_dir.glob("workspace_*.npy"):
+        path.unlink()
+
+    start = perf_counter()
+    workspace = Workspace()
+    print(f"build: {(perf_counter() - start) * 1e3:8.1f} ms, grid {workspace.shape}")
+
+    start = perf_counter()
+    workspace = Workspace(workspace.dh)
+    print(f"load (memory-mapped): {(perf_counter() - start) * 1e3:8.1f} ms")
+
+    # Joystick steps around the whole grid
+    rng = np.random.default_rng(0)
+    targets = rng.uniform(workspace.origin, -workspace.origin + [0, 0, 500], (2000, 3))
+    reachable = workspace.reachable(targets)
+    print(f"reachable: {reachable.mean() * 100:.1f}% of the sampled targets")
+
+    for name, query in (
+        ("is_reachable", workspace.is_reachable),
+        ("project", workspace.project),
+        ("bw_kinematics", lambda p: workspace.dh.bw_kinematics(p, [0, 0, 0])),
+    ):
+        start = perf_counter()
+        for target in targets[~reachable][:500]:
+            query(target)
+        elapsed = perf_counter() - start
+        print(f"{name:>14}: {elapsed / 500 * 1e6:8.1f} us per unreachable target")
+
+    # Projected points must be reachable by the inverse kinematics
+    projected = np.array([workspace.project(p) for p in targets[~reachable][:500]])
+    errors = [
+        np.linalg.norm(workspace.dh.last_pos(workspace.dh.bw_kinematics(p, [0, 0, 0])) - p)
+        for p in projected
+    ]
+    print(f"projected points, max IK error: {max(errors):.2e} mm")
+
+
+if __name__ == "__main__":
+    main()
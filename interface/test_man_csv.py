@@ -0,0 +1,76 @@
+"""
+Tests of the batch CSV angle conversion.
+
+    python -m pytest test_man_csv.py    (from the interface folder)
+"""
+
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+INTERFACE = Path(__file__).resolve().parent
+sys.path.insert(0, str(INTERFACE))
+
+import man_csv
+
+CSV = INTERFACE / "final.csv"
+
+
+@pytest.mark.parametrize("chunksize", [1, 100_000])
+def test_only_the_angle_columns_are_converted(tmp_path, chunksize):
+    destination = tmp_path / "final_deg.csv"
+    rows = man_csv.convert_file(CSV, destination, "rad2deg", chunksize)
+
+    source, converted = pd.read_csv(CSV), pd.read_csv(destination)
+    assert rows == len(source)
+    assert list(converted.columns) == list(source.columns)
+    for column in source.columns:
+        expected = np.rad2deg(source[column]) if column in ("j1", "j2", "j3") else source[column]
+        np.testing.assert_allclose(converted[column], expected)
+    assert list(tmp_path.iterdir()) == [destination]    # No temporary file left
+
+
+def test_round_trip(tmp_path):
+    man_csv.convert_file(CSV, tmp_path / "deg.csv", "rad2deg")
+    man_csv.convert_file(tmp_path / "deg.csv", tmp_path / "rad.csv", "deg2rad")
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / "rad.csv"), pd.read_csv(CSV))
+
+
+def test_schema_selects_the_columns(tmp_path):
+    schema = dict(man_csv.SCHEMA, j4="rad", j1="deg")
+    man_csv.convert_file(CSV, tmp_path / "out.csv", "rad2deg", schema=schema)
+    source, converted = pd.read_csv(CSV), pd.read_csv(tmp_path / "out.csv")
+    np.testing.assert_allclose(converted["j1"], source["j1"])
+    np.testing.assert_allclose(converted["j4"], np.rad2deg(source["j4"]))
+
+
+def test_header_only_file(tmp_path):
+    source = tmp_path / "empty.csv"
+    source.write_text("j1,j2,j3,j4,si,sf,time\n")
+    assert man_csv.convert_file(source, tmp_path / "out.csv", "rad2deg") == 0
+    assert (tmp_path / "out.csv").read_text() == source.read_text()
+
+
+def test_convert_files(tmp_path):
+    for name in ("a.csv", "b.csv"):
+        shutil.copy(CSV, tmp_path / name)
+    rows, _ = man_csv.convert_files([str(tmp_path / "*.csv")], "rad2deg", workers=1)
+    assert rows == 2*len(pd.read_csv(CSV))
+    assert (tmp_path / "a_deg.csv").exists() and (tmp_path / "b_deg.csv").exists()
+
+
+def test_output_collisions_are_refused(tmp_path):
+    for folder in ("one", "two"):
+        (tmp_path / folder).mkdir()
+        shutil.copy(CSV, tmp_path / folder / "final.csv")
+    patterns = [str(tmp_path / "one" / "final.csv"), str(tmp_path / "two" / "final.csv")]
+
+    with pytest.raises(ValueError, match="several inputs"):
+        man_csv.convert_files(patterns, "rad2deg", output_dir=tmp_path / "out")
+    with pytest.raises(ValueError, match="overwritten"):
+        man_csv.convert_files(patterns[:1], "rad2deg", output_dir=tmp_path / "one")
+    assert not (tmp_path / "out").exists()